@@ -0,0 +1,110 @@
+"""Время объединения сдвоенных уроков (LessonService._double_lessons)
+на неделе синтетической школы.
+
+Уроки строятся как словари TimetableSnapshot.get_lessons: отсортированы по
+времени начала за всю неделю, урок всего класса повторяется для каждой
+подгруппы, одинаковые уроки идут блоками по 1-3. Измеряются неделя
+каждого класса одним списком (GET /api/lessons?do_double=true), неделя,
+сгруппированная по дням (get_list с group_by_weekdays), и вся школа одним
+списком.
+
+    python benchmarks/double_lessons.py [--classes 10 50 200] [--repeat 20]
+"""
+import argparse
+import time
+from itertools import groupby
+
+from time_api.schemas.teachers import Teacher
+from time_api.services.lessons import LessonService
+
+
+LESSONS = ['алгебра', 'физика', 'история', 'химия', 'литература',
+           'русский язык', 'биология', 'информатика']
+
+
+def make_week(
+        class_number: int,
+        lessons_per_day: int = 8,
+        subgroups: int = 2,
+        weekdays: int = 6
+) -> list[dict]:
+    teachers = [Teacher(teacher_id=i + 1, name=f'Учитель {i + 1}')
+                for i in range(len(LESSONS))]
+    lessons = []
+    for weekday in range(weekdays):
+        n = 0
+        block = 0
+        while n < lessons_per_day:
+            name_index = (class_number + weekday + block) % len(LESSONS)
+            for _ in range(min(1 + block % 3, lessons_per_day - n)):
+                lesson = {
+                    'lesson_id': class_number * 1000 + weekday * 100 + n,
+                    'name': LESSONS[name_index],
+                    'start_time': {'hour': 8 + n, 'minute': 0},
+                    'end_time': {'hour': 8 + n, 'minute': 40},
+                    'week': None,
+                    'weekday': weekday,
+                    'room': str(100 + class_number),
+                    'school_id': 1,
+                    'teacher': teachers[name_index],
+                }
+                lessons.extend(dict(lesson) for _ in range(subgroups))
+                n += 1
+            block += 1
+    lessons.sort(key=lambda i: (i['start_time']['hour'],
+                                i['start_time']['minute']))
+    return lessons
+
+
+def measure(function, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--classes', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    service = LessonService(session=None, response=None)
+
+    print(f'{"classes":>8} {"case":<16} {"lessons":>8} {"result":>7} '
+          f'{"ms":>9} {"lessons/s":>11}')
+    for classes in args.classes:
+        weeks = [make_week(class_number) for class_number in range(classes)]
+        by_weekday = [
+            [list(day) for _, day in groupby(
+                sorted(week, key=lambda i: i['weekday']),
+                lambda i: i['weekday'])]
+            for week in weeks
+        ]
+        school = sorted((lesson for week in weeks for lesson in week),
+                        key=lambda i: (i['start_time']['hour'],
+                                       i['start_time']['minute']))
+        cases = [
+            ('class week', lambda: [service._double_lessons(week)
+                                    for week in weeks]),
+            ('by weekday', lambda: [[service._double_lessons(day)
+                                     for day in days]
+                                    for days in by_weekday]),
+            ('school week', lambda: service._double_lessons(school)),
+        ]
+        for name, function in cases:
+            result = function()
+            if name == 'by weekday':
+                result = [day for days in result for day in days]
+            if name != 'school week':
+                result = [lesson for items in result for lesson in items]
+            best = measure(function, args.repeat)
+            print(f'{classes:>8} {name:<16} {len(school):>8} '
+                  f'{len(result):>7} {best * 1000:>9.2f} '
+                  f'{len(school) / best:>11.0f}')
+
+
+if __name__ == '__main__':
+    main()
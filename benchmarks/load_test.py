@@ -0,0 +1,315 @@
+"""Нагрузочный тест запущенного сервера смесями реального трафика.
+
+Сервер запускается отдельно с той конфигурацией, которую нужно проверить
+(число воркеров, размер пула, кэш), база заполняется seed_db:
+
+    seed_db --schools 1 --classes 30 --hotfixes 50
+    ADMIN_TOKEN=... ADMIN_PASSWORD=... uvicorn time_api.main:app --port 8000
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 \\
+        --mix morning hotfixes reimport --users 100 --duration 30 \\
+        --token $ADMIN_TOKEN
+
+Смеси (--mix) выполняются по очереди, каждая --duration секунд:
+
+    morning   утренний всплеск: все пользователи сразу открывают nearest_day
+    hotfixes  чтение расписания, учителя добавляют замены
+    reimport  чтение расписания, администратор повторно загружает xlsx
+              расписание отдельной школы и ждёт завершения задачи
+
+hotfixes и reimport требуют токен с правами администратора (--token).
+Для reimport сервер должен читать .xlsx, то есть иметь openpyxl из
+requirements.txt.
+Для каждого вида запросов печатаются число запросов, доля ошибок, медиана,
+p95 и p99. Скрипт завершается с кодом 1, если p95 или p99 превышают SLO
+(по умолчанию SLO, изменяется --slo имя=p95,p99 в мс) или доля ошибок
+больше --max-error-rate.
+"""
+import argparse
+import asyncio
+import datetime as dt
+import math
+import random
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+
+import httpx
+
+from workbook import make_workbook
+
+
+# p95 и p99 в миллисекундах
+SLO = {
+    'nearest_day': (100, 250),
+    'lessons': (150, 300),
+    'subgroups': (50, 150),
+    'hotfix': (300, 600),
+    'import': (30_000, 60_000),
+}
+
+# Веса запросов пользователей и фоновая задача администратора
+MIXES = {
+    'morning': ({'nearest_day': 90, 'lessons': 5, 'subgroups': 5}, None),
+    'hotfixes': ({'nearest_day': 60, 'lessons': 25, 'hotfix': 15}, None),
+    'reimport': ({'nearest_day': 70, 'lessons': 30}, 'import'),
+}
+
+
+class Stats:
+    def __init__(self):
+        self.timings: defaultdict[str, list[float]] = defaultdict(list)
+        self.errors: Counter[str] = Counter()
+
+    def add(self, name: str, elapsed: float, ok: bool):
+        self.timings[name].append(elapsed)
+        if not ok:
+            self.errors[name] += 1
+
+
+class Target:
+    """Данные сервера, к которым обращаются пользователи"""
+
+    def __init__(self, token: str | None):
+        self.token = token
+        self.school_id: int | None = None
+        self.class_ids: list[int] = []
+        self.lessons: list[dict] = []
+        self.import_school_id: int | None = None
+        self.workbooks: list[bytes] = []
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {'auth-token': self.token or ''}
+
+
+async def request(
+        client: httpx.AsyncClient,
+        stats: Stats,
+        name: str,
+        method: str,
+        path: str,
+        expected: tuple[int, ...] = (200,),
+        **kwargs
+) -> httpx.Response | None:
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, path, **kwargs)
+    except httpx.HTTPError:
+        stats.add(name, time.perf_counter() - started, False)
+        return None
+    ok = response.status_code in expected
+    stats.add(name, time.perf_counter() - started, ok)
+    return response if ok else None
+
+
+async def get_nearest_day(client, target: Target, stats: Stats):
+    await request(client, stats, 'nearest_day', 'GET',
+                  '/api/lessons/nearest_day',
+                  params={'class_id': random.choice(target.class_ids)})
+
+
+async def get_lessons(client, target: Target, stats: Stats):
+    await request(client, stats, 'lessons', 'GET', '/api/lessons',
+                  params={'class_id': random.choice(target.class_ids),
+                          'do_double': random.random() < 0.5})
+
+
+async def get_subgroups(client, target: Target, stats: Stats):
+    await request(client, stats, 'subgroups', 'GET', '/api/subgroups',
+                  params={'school_id': target.school_id})
+
+
+async def create_hotfix(client, target: Target, stats: Stats):
+    lesson = random.choice(target.lessons)
+    for_date = dt.date.today() + dt.timedelta(days=random.randrange(7))
+    await request(client, stats, 'hotfix', 'PATCH', '/api/lessons/',
+                  expected=(201,), headers=target.headers, json={
+                      'lesson_id': lesson['lesson_id'],
+                      'name': lesson['name'],
+                      'start_time': lesson['start_time'],
+                      'end_time': lesson['end_time'],
+                      'room': f'{lesson["room"]}a',
+                      'teacher_id': lesson['teacher']['teacher_id'],
+                      'is_existing': True,
+                      'for_date': {'day': for_date.day,
+                                   'month': for_date.month,
+                                   'year': for_date.year},
+                  })
+
+
+async def reimport(client, target: Target, stats: Stats):
+    """Загрузка одного из двух файлов по очереди, поэтому каждая загрузка
+    меняет расписание. Время - от отправки файла до завершения задачи"""
+    target.workbooks.reverse()
+    started = time.perf_counter()
+    response = await request(
+        client, stats, 'import_submit', 'POST', '/api/timetable',
+        expected=(202,), headers=target.headers,
+        params={'school_id': target.import_school_id},
+        files={'lessons_file': ('timetable.xlsx', target.workbooks[0])}
+    )
+    if response is None:
+        return
+    job_id = response.json()['job_id']
+    job = {'status': 'queued'}
+    while job['status'] not in ('done', 'failed'):
+        await asyncio.sleep(0.2)
+        response = await client.get(f'/api/timetable/jobs/{job_id}',
+                                    headers=target.headers)
+        if response.status_code != 200:
+            break
+        job = response.json()
+    stats.add('import', time.perf_counter() - started,
+              job['status'] == 'done')
+
+
+ACTIONS = {
+    'nearest_day': get_nearest_day,
+    'lessons': get_lessons,
+    'subgroups': get_subgroups,
+    'hotfix': create_hotfix,
+    'import': reimport,
+}
+
+
+async def prepare(client, target: Target, school_id: int | None,
+                  import_classes: int):
+    response = await client.get('/api/schools')
+    response.raise_for_status()
+    schools = response.json()['schools']
+    if not schools:
+        sys.exit('No schools, create them with seed_db')
+    target.school_id = school_id or schools[0]['school_id']
+    response = await client.get('/api/classes',
+                                params={'school_id': target.school_id})
+    response.raise_for_status()
+    target.class_ids = [item['class_id']
+                        for item in response.json()['classes']]
+    if not target.class_ids:
+        sys.exit(f'School {target.school_id} has no classes')
+    for class_id in target.class_ids[:5]:
+        response = await client.get('/api/lessons',
+                                    params={'class_id': class_id})
+        response.raise_for_status()
+        target.lessons.extend(response.json()['lessons'])
+
+    if target.token:
+        response = await client.post('/api/schools', headers=target.headers,
+                                     json={'name': 'Нагрузочный тест',
+                                           'address': 'load_test.py',
+                                           'is_using_double_week': False})
+        response.raise_for_status()
+        target.import_school_id = response.json()['school_id']
+        target.workbooks = [make_workbook(import_classes),
+                            make_workbook(import_classes, 6)]
+
+
+async def run_mix(client, target: Target, mix: str, users: int,
+                  duration: float, ramp: float, think: float) -> Stats:
+    weights, admin_action = MIXES[mix]
+    names = list(weights)
+    stats = Stats()
+    deadline = time.monotonic() + duration
+
+    async def user():
+        await asyncio.sleep(random.uniform(0, ramp))
+        while time.monotonic() < deadline:
+            name = random.choices(names, [weights[n] for n in names])[0]
+            await ACTIONS[name](client, target, stats)
+            if think:
+                await asyncio.sleep(random.expovariate(1 / think))
+
+    async def admin():
+        while time.monotonic() < deadline:
+            await ACTIONS[admin_action](client, target, stats)
+
+    tasks = [user() for _ in range(users)]
+    if admin_action is not None:
+        tasks.append(admin())
+    await asyncio.gather(*tasks)
+    return stats
+
+
+def percentile(timings: list[float], q: float) -> float:
+    return timings[max(math.ceil(q * len(timings)) - 1, 0)]
+
+
+def report(stats: Stats, slo: dict[str, tuple[float, float]],
+           max_error_rate: float, duration: float) -> list[str]:
+    """Печатает таблицу и возвращает нарушения SLO"""
+    failures = []
+    print(f'  {"request":<14} {"count":>7} {"rps":>7} {"errors":>7} '
+          f'{"median":>9} {"p95":>9} {"p99":>9}')
+    for name, timings in sorted(stats.timings.items()):
+        timings.sort()
+        errors = stats.errors[name] / len(timings)
+        p95 = percentile(timings, 0.95) * 1000
+        p99 = percentile(timings, 0.99) * 1000
+        print(f'  {name:<14} {len(timings):>7} '
+              f'{len(timings) / duration:>7.1f} {errors:>7.2%} '
+              f'{statistics.median(timings) * 1000:>7.1f}ms '
+              f'{p95:>7.1f}ms {p99:>7.1f}ms')
+        if errors > max_error_rate:
+            failures.append(f'{name}: error rate {errors:.2%} > '
+                            f'{max_error_rate:.2%}')
+        if name in slo:
+            p95_slo, p99_slo = slo[name]
+            if p95 > p95_slo:
+                failures.append(f'{name}: p95 {p95:.1f}ms > {p95_slo}ms')
+            if p99 > p99_slo:
+                failures.append(f'{name}: p99 {p99:.1f}ms > {p99_slo}ms')
+    return failures
+
+
+def parse_slo(value: str) -> tuple[str, tuple[float, float]]:
+    name, _, limits = value.partition('=')
+    p95, p99 = (float(limit) for limit in limits.split(','))
+    return name, (p95, p99)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--mix', nargs='+', choices=list(MIXES),
+                        default=['morning'])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--ramp', type=float, default=0,
+                        help='seconds to spread the start of users over')
+    parser.add_argument('--think', type=float, default=0,
+                        help='mean pause between requests of a user')
+    parser.add_argument('--token', help='admin token for hotfixes and '
+                                        'reimport')
+    parser.add_argument('--school-id', type=int)
+    parser.add_argument('--import-classes', type=int, default=30)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--slo', type=parse_slo, action='append',
+                        default=[], help='name=p95,p99 in ms')
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    args = parser.parse_args()
+    if not args.token and {'hotfixes', 'reimport'} & set(args.mix):
+        parser.error('hotfixes and reimport require --token')
+    slo = SLO | dict(args.slo)
+
+    target = Target(args.token)
+    failures = []
+    async with httpx.AsyncClient(
+            base_url=args.url, timeout=args.timeout,
+            limits=httpx.Limits(max_connections=args.users + 1)
+    ) as client:
+        await prepare(client, target, args.school_id, args.import_classes)
+        for mix in args.mix:
+            print(f'{mix}: {args.users} users, {args.duration:.0f}s')
+            stats = await run_mix(client, target, mix, args.users,
+                                  args.duration, args.ramp, args.think)
+            failures += [f'{mix} {failure}' for failure in
+                         report(stats, slo, args.max_error_rate,
+                                args.duration)]
+    for failure in failures:
+        print(f'FAIL {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+"""Время разбора расписания парсером в зависимости от числа классов.
+
+Таблица строится сразу в виде DataFrame в формате read_df, поэтому
+измеряется только process_by_days, без чтения xlsx.
+
+    python benchmarks/parser_scaling.py [--classes 1 10 25 50] [--repeat 3]
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from time_api.services.parser import process_by_days
+
+
+WEEKDAYS = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота']
+LESSONS = ['физика', 'история', 'русский язык', 'алгебра', 'химия', 'литература']
+LETTERS = 'абвгдежзиклмнопрстуфхцчшщэюя'
+
+
+def make_frame(classes: int, lessons_per_day: int = 7) -> pd.DataFrame:
+    class_columns = [f'Unnamed: {i + 2}' for i in range(classes)]
+    # Уникальные названия вида 1а..11я, которые разбирает split_class_name
+    class_names = [f'{1 + i % 11}{LETTERS[i // 11 % len(LETTERS)]}'
+                   for i in range(classes)]
+    rows = []
+    for weekday in WEEKDAYS:
+        rows.append([weekday, 'время'] + class_names)
+        for n in range(lessons_per_day):
+            start = 8 + n
+            time_range = f'{start}.00-{start}.40' if n % 2 else f'{start}.00-{start + 1}.30'
+            rows.append([weekday, time_range] + [
+                f'{LESSONS[(n + i) % len(LESSONS)]} {20 + i % 10}'
+                for i in range(classes)
+            ])
+    return pd.DataFrame(rows, columns=['WeekDay', 'Time'] + class_columns)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--classes', type=int, nargs='+', default=[1, 5, 10, 25, 50])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'{"classes":>8} {"rows":>8} {"seconds":>10} {"rows/s":>10} {"ms/class":>10}')
+    for classes in args.classes:
+        df = make_frame(classes)
+        best = None
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = process_by_days(df)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        print(f'{classes:>8} {len(result):>8} {best:>10.4f} '
+              f'{len(result) / best:>10.0f} {best / classes * 1000:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
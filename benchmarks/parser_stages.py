@@ -0,0 +1,66 @@
+"""Время и пиковая память каждого этапа разбора xlsx расписания.
+
+Файлы генерируются benchmarks/workbook.py. Этапы: чтение xlsx (read_df),
+разбор таблицы (process_by_days), преобразование в записи (to_dict) и
+parse_timetable целиком. Время - лучшее из --repeat запусков, пик памяти
+по tracemalloc снимается отдельным запуском, так как tracemalloc
+замедляет код.
+
+    python benchmarks/parser_stages.py [--classes 1 10 50 100 200] [--repeat 3]
+"""
+import argparse
+import time
+import tracemalloc
+from typing import Any, Callable
+
+from workbook import make_workbook
+from time_api.services.parser import parse_timetable, process_by_days, read_df
+
+
+def get_stages(file: bytes) -> list[tuple[str, Callable, Any]]:
+    df = read_df(file)
+    lessons = process_by_days(df)
+    return [
+        ('read_df', read_df, file),
+        ('process_by_days', process_by_days, df),
+        ('to_dict', lambda frame: frame.to_dict(orient='records'), lessons),
+        ('parse_timetable', parse_timetable, file),
+    ]
+
+
+def measure(function: Callable, argument: Any, repeat: int) -> tuple[float, int]:
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(argument)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    function(argument)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--classes', type=int, nargs='+',
+                        default=[1, 10, 50, 100, 200])
+    parser.add_argument('--lessons', type=int, default=7)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'{"classes":>8} {"file KB":>8} {"stage":<16} {"rows":>7} '
+          f'{"seconds":>9} {"peak MB":>8} {"rows/s":>9}')
+    for classes in args.classes:
+        file = make_workbook(classes, args.lessons)
+        rows = len(process_by_days(read_df(file)))
+        for name, function, argument in get_stages(file):
+            best, peak = measure(function, argument, args.repeat)
+            print(f'{classes:>8} {len(file) / 1024:>8.0f} {name:<16} '
+                  f'{rows:>7} {best:>9.4f} {peak / 2 ** 20:>8.1f} '
+                  f'{rows / best:>9.0f}')
+
+
+if __name__ == '__main__':
+    main()
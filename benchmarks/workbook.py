@@ -0,0 +1,46 @@
+"""Генератор xlsx файлов расписания в формате, который ожидает парсер.
+
+Шапка таблицы в пятой строке (read_df читает с header=4): колонки WeekDay
+и Time, столбцы классов без заголовка (pandas называет их Unnamed: N).
+Каждый день начинается строкой 'время' с названиями классов, день недели
+указан только в ней и протягивается read_df.
+
+    python benchmarks/workbook.py --classes 50 --output timetable.xlsx
+"""
+import argparse
+import io
+
+import openpyxl
+
+from parser_scaling import make_frame
+
+
+def make_workbook(classes: int, lessons_per_day: int = 7) -> bytes:
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = 'Расписание'
+    sheet.append(['Расписание уроков'])
+    for _ in range(3):
+        sheet.append([None])
+    sheet.append(['WeekDay', 'Time'])
+    for weekday, time, *lessons in make_frame(
+            classes, lessons_per_day).itertuples(index=False):
+        sheet.append([weekday if time == 'время' else None, time, *lessons])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--classes', type=int, default=10)
+    parser.add_argument('--lessons', type=int, default=7)
+    parser.add_argument('--output', default='timetable.xlsx')
+    args = parser.parse_args()
+    with open(args.output, 'wb') as file:
+        file.write(make_workbook(args.classes, args.lessons))
+    print(f'{args.output}: {args.classes} classes')
+
+
+if __name__ == '__main__':
+    main()
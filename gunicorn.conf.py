@@ -0,0 +1,6 @@
+from time_api.db.create import settings
+
+
+# Postgres должен выдерживать workers * (db_pool_size + db_max_overflow)
+# соединений
+workers = settings.workers
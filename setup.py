@@ -7,7 +7,8 @@ install_requires = [
     'fastapi',
     'uvicorn',
     'sqlalchemy[asyncio]',
-    'gunicorn'
+    'gunicorn',
+    'prometheus_client'
 ]
 
 setup(
@@ -23,6 +24,7 @@ setup(
         'console_scripts': [
             'init_models = time_api.db.base:run_init_models',
             'init_db = time_api.db.create:run_init_db',
+            'seed_db = time_api.db.seed:run_seed',
         ]
     }
 )
@@ -0,0 +1,83 @@
+import os
+import re
+
+import fakeredis
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from time_api.db import base
+from time_api.main import app
+from time_api.services import auth, cache, jobs
+
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+
+@pytest.fixture
+async def session_maker(tmp_path):
+    engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/test.db')
+    async with engine.begin() as conn:
+        await conn.run_sync(base.Base.metadata.create_all)
+    yield sessionmaker(engine, class_=AsyncSession, expire_on_commit=False,
+                       autoflush=False)
+    await engine.dispose()
+
+
+@pytest.fixture
+async def postgres_session_maker():
+    """Сессии Postgres из TEST_POSTGRES_URL с пересозданными таблицами.
+    Тест пропускается, если база не задана или недоступна"""
+    url = os.environ.get('TEST_POSTGRES_URL')
+    if not url:
+        pytest.skip('TEST_POSTGRES_URL is not set')
+    engine = create_async_engine(url)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(base.Base.metadata.drop_all)
+            await conn.run_sync(base.Base.metadata.create_all)
+    except OSError as e:
+        await engine.dispose()
+        pytest.skip(f'Postgres is unavailable: {e}')
+    yield sessionmaker(engine, class_=AsyncSession, expire_on_commit=False,
+                       autoflush=False)
+    await engine.dispose()
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    """Пустой Redis в памяти и холодные кэши процесса"""
+    connection = fakeredis.FakeAsyncRedis(decode_responses=True)
+    for service in (cache.schedule_version, cache.response_cache,
+                    auth.authenticate, jobs.import_jobs):
+        monkeypatch.setattr(service, 'connection', connection)
+    cache.timetable_cache.invalidate()
+    cache.timetable_cache._class_schools.clear()
+    cache.timetable_cache._subgroup_schools.clear()
+    return connection
+
+
+@pytest.fixture
+async def client(session_maker, redis):
+    async def get_session():
+        async with session_maker() as session:
+            yield session
+
+    app.dependency_overrides[base.get_session] = get_session
+    async with AsyncClient(transport=ASGITransport(app=app),
+                           base_url='http://test') as client:
+        yield client
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def query_count():
+    """Число запросов к БД из заголовка Server-Timing ответа"""
+    def get(response) -> int:
+        timing = response.headers['server-timing']
+        return int(re.search(r'desc="(\d+) queries"', timing).group(1))
+
+    return get
@@ -0,0 +1,99 @@
+import asyncio
+
+import fakeredis
+import pytest
+from redis.asyncio import BlockingConnectionPool
+
+from time_api.services.auth import (
+    SignedTokens, TokenAuth, TokenCache, authenticate
+)
+from time_api.services.cache import redis_connection, response_cache
+
+
+def test_auth_and_cache_share_blocking_pool():
+    """Команды сверх размера пула ждут соединение, а не падают с
+    Too many connections"""
+    assert authenticate.connection is redis_connection
+    assert response_cache.connection is redis_connection
+    assert isinstance(redis_connection.connection_pool,
+                      BlockingConnectionPool)
+
+
+@pytest.mark.anyio
+async def test_unavailable_redis_returns_503(client, monkeypatch):
+    server = fakeredis.FakeServer()
+    server.connected = False
+    monkeypatch.setattr(authenticate, 'connection',
+                        fakeredis.FakeAsyncRedis(server=server,
+                                                 decode_responses=True))
+    response = await client.post('/api/schools',
+                                 headers={'auth-token': 'token'},
+                                 json={'name': 'Лицей', 'address': 'Адрес',
+                                       'is_using_double_week': False})
+    assert response.status_code == 503
+    assert response.headers['retry-after'] == '1'
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('token', ['a.b.é', 'é.b.c'])
+async def test_non_ascii_signed_token_is_rejected(redis, token):
+    tokens = SignedTokens(redis, 'secret', refresh=5)
+    assert await tokens.decode(token) is None
+    assert await tokens.decode(tokens.encode({'name': 'admin'}, 60)) \
+        is not None
+
+
+@pytest.fixture
+async def cached_auth(redis):
+    await redis.hset('token', mapping={'name': 'teacher', 'password': '',
+                                       'access_level': 2})
+    return TokenAuth(redis, cache_size=2, cache_ttl=60)
+
+
+@pytest.mark.anyio
+async def test_cached_token_is_not_read_from_redis(cached_auth, redis):
+    await cached_auth.get_info_by_token('token')
+    await redis.delete('token')
+    assert (await cached_auth.get_info_by_token('token'))['name'] \
+        == 'teacher'
+    assert cached_auth.cache.hits == 1
+
+
+@pytest.mark.anyio
+async def test_cached_token_expires_after_ttl(redis):
+    await redis.hset('token', mapping={'name': 'teacher', 'password': '',
+                                       'access_level': 2})
+    auth = TokenAuth(redis, cache_size=2, cache_ttl=0.05)
+    await auth.get_info_by_token('token')
+    await redis.delete('token')
+    await asyncio.sleep(0.1)
+    assert await auth.get_info_by_token('token') == {}
+
+
+@pytest.mark.anyio
+async def test_cached_token_expires_with_redis_token(cached_auth, redis):
+    """Кэш не продлевает токен дольше срока его жизни в Redis"""
+    await redis.pexpire('token', 50)
+    await cached_auth.get_info_by_token('token')
+    await asyncio.sleep(0.1)
+    assert await cached_auth.get_info_by_token('token') == {}
+
+
+def test_token_cache_evicts_least_recently_used():
+    cache = TokenCache(size=2, ttl=60)
+    cache.set('a', {'name': 'a'})
+    cache.set('b', {'name': 'b'})
+    assert cache.get('a') == {'name': 'a'}
+    cache.set('c', {'name': 'c'})
+    assert cache.get('b') is None
+    assert cache.get('a') == {'name': 'a'}
+    assert cache.get('c') == {'name': 'c'}
+
+
+@pytest.mark.anyio
+async def test_refresh_drops_cached_token(cached_auth, redis):
+    await cached_auth.get_info_by_token('token')
+    await redis.hset('token', 'access_level', 1)
+    await cached_auth.refresh_token('token')
+    assert (await cached_auth.get_info_by_token('token'))['access_level'] \
+        == '1'
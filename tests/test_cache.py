@@ -0,0 +1,156 @@
+import asyncio
+import datetime as dt
+import time
+
+import pytest
+from fastapi import Response
+
+from time_api.db import base, tables
+from time_api.db.seed import seed
+from time_api.main import app
+from time_api.services.cache import response_cache
+from time_api.services.parser import TimetableService
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_school_lists_follow_global_version(session_maker, client,
+                                                  redis):
+    """Школа, добавленная другим процессом, появляется в выдаче после
+    изменения общей версии расписания в Redis"""
+    async with session_maker() as session:
+        await seed(session, classes=1, weekdays=1)
+    teacher = await client.get('/api/lessons?teacher_id=1')
+    everything = await client.get('/api/lessons')
+
+    async with session_maker() as session:
+        [school_id] = await seed(session, classes=1, weekdays=1,
+                                 random_seed=1)
+        session.add(tables.Lesson(name='физика', start_time=dt.time(15),
+                                  end_time=dt.time(15, 40), weekday=0,
+                                  room='1', teacher_id=1,
+                                  school_id=school_id))
+        await session.commit()
+    await redis.incr(f'schedule:version:{school_id}')
+    await redis.incr('schedule:version')
+
+    new_teacher = await client.get('/api/lessons?teacher_id=1')
+    new_everything = await client.get('/api/lessons')
+    assert len(new_teacher.json()['lessons']) \
+        == len(teacher.json()['lessons']) + 1
+    assert {lesson['school_id']
+            for lesson in new_everything.json()['lessons']} \
+        == {1, school_id}
+    assert len(new_everything.json()['lessons']) \
+        > len(everything.json()['lessons'])
+
+
+async def test_created_school_bumps_version(client, redis):
+    await redis.hset('admin', mapping={'name': 'admin', 'password': '',
+                                       'access_level': 3})
+    response = await client.post('/api/schools',
+                                 headers={'auth-token': 'admin'},
+                                 json={'name': 'Новая', 'address': 'Адрес',
+                                       'is_using_double_week': False})
+    assert response.status_code == 201
+    assert await redis.get('schedule:version') == '1'
+
+
+async def test_waiter_stops_when_lock_is_released(redis):
+    """Если владелец блокировки не записал ответ, ожидающие процессы
+    вычисляют его сами, не дожидаясь истечения блокировки"""
+    key = 'response:test'
+    await redis.set(f'{key}:lock', 'token', px=5000)
+
+    async def release():
+        await asyncio.sleep(0.1)
+        await redis.delete(f'{key}:lock')
+
+    async def compute():
+        return {'ok': True}
+
+    started = time.monotonic()
+    _, body = await asyncio.gather(
+        release(), response_cache._get_or_compute(key, compute)
+    )
+    assert body == b'{"ok":true}'
+    assert time.monotonic() - started < 1
+
+
+async def test_matching_etag_returns_304_without_queries(
+        session_maker, client, query_count):
+    async with session_maker() as session:
+        await seed(session, classes=1, weekdays=1)
+    # Первый запрос загружает снимок школы, после него ETag строится из
+    # версии школы, а не общей
+    await client.get('/api/lessons?class_id=1')
+    response = await client.get('/api/lessons?class_id=1')
+    etag = response.headers['etag']
+
+    response = await client.get('/api/lessons?class_id=1',
+                                headers={'if-none-match': etag})
+    assert response.status_code == 304
+    assert response.headers['etag'] == etag
+    assert query_count(response) == 0
+
+
+async def test_hotfix_changes_etag(session_maker, client, redis):
+    async with session_maker() as session:
+        await seed(session, classes=1, weekdays=1)
+    await redis.hset('admin', mapping={'name': 'admin', 'password': '',
+                                       'access_level': 3})
+    await client.get('/api/lessons?class_id=1')
+    etag = (await client.get('/api/lessons?class_id=1')).headers['etag']
+    today = dt.date.today()
+    response = await client.patch(
+        '/api/lessons/', headers={'auth-token': 'admin'},
+        json={'lesson_id': 1, 'name': 'физика', 'room': '1',
+              'start_time': {'hour': 8, 'minute': 0},
+              'end_time': {'hour': 8, 'minute': 40},
+              'is_existing': True,
+              'for_date': {'day': today.day, 'month': today.month,
+                           'year': today.year}}
+    )
+    assert response.status_code == 201
+
+    response = await client.get('/api/lessons?class_id=1',
+                                headers={'if-none-match': etag})
+    assert response.status_code == 200
+    assert response.headers['etag'] != etag
+
+
+async def test_import_changes_etag(postgres_session_maker, client):
+    """ETag списка классов меняется после загрузки расписания школы"""
+    async def get_session():
+        async with postgres_session_maker() as session:
+            yield session
+
+    app.dependency_overrides[base.get_session] = get_session
+    async with postgres_session_maker() as session:
+        session.add_all([
+            tables.School(name='Лицей', address='Адрес',
+                          is_using_double_week=False),
+            tables.Teacher(name='Учитель'),
+        ])
+        await session.flush()
+        session.add(tables.Class(number=10, letter='А', school_id=1))
+        await session.commit()
+    response = await client.get('/api/classes?school_id=1')
+    etag = response.headers['etag']
+    lesson = dict(class_number='10', class_letter='А', subgroup='1',
+                  name='алгебра', teacher_id=1, week=0, weekday=0,
+                  start_hour=8, start_minute=0, end_hour=8, end_minute=40,
+                  room='20', required=True, teacher='Учитель')
+    async with postgres_session_maker() as session:
+        service = TimetableService(session, Response())
+        await service.create_classes(
+            dict(class_numbers=['10'], class_letters=['А'],
+                 subgroup_names=['1'], lessons=[lesson]), 1
+        )
+        await service.create([lesson], 1)
+
+    response = await client.get('/api/classes?school_id=1',
+                                headers={'if-none-match': etag})
+    assert response.status_code == 200
+    assert response.headers['etag'] != etag
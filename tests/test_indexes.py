@@ -0,0 +1,78 @@
+"""Планы запросов основных путей чтения расписания на 100 школах.
+
+Нужен Postgres: TEST_POSTGRES_URL=postgresql+asyncpg://.../test_db.
+Таблицы в этой базе пересоздаются. Последовательное чтение отключено,
+поэтому тест проверяет, что индекс подходит к запросу, а не выбор
+планировщика на маленьких таблицах"""
+import datetime as dt
+import os
+
+import pytest
+from sqlalchemy import select, distinct, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from time_api.db import base, tables
+from time_api.db.seed import seed
+
+
+pytestmark = pytest.mark.anyio
+
+TODAY = dt.date.today()
+QUERIES = [
+    ('ix_lessons_school_id_weekday_start_time',
+     select(tables.Lesson.lesson_id).filter_by(school_id=50, weekday=2)
+     .order_by(tables.Lesson.start_time)),
+    ('ix_lessons_teacher_id_weekday_start_time',
+     select(distinct(tables.Lesson.school_id)).filter_by(teacher_id=100)),
+    ('ix_lesson_subgroups_subgroup_id_lesson_id',
+     select(tables.LessonSubgroup.lesson_id).filter_by(subgroup_id=100)),
+    ('ix_lessons_hotfix_for_date_lesson_id',
+     select(tables.LessonHotfix.hotfix_id).filter(
+         tables.LessonHotfix.for_date >= TODAY,
+         tables.LessonHotfix.for_date <= TODAY + dt.timedelta(days=7))),
+    ('ix_semesters_end_date_start_date',
+     select(tables.Semester.semester_id).filter(
+         tables.Semester.start_date <= TODAY,
+         tables.Semester.end_date >= TODAY)),
+]
+
+
+@pytest.fixture(scope='module')
+def anyio_backend():
+    return 'asyncio'
+
+
+@pytest.fixture(scope='module')
+async def engine():
+    url = os.environ.get('TEST_POSTGRES_URL')
+    if not url:
+        pytest.skip('TEST_POSTGRES_URL is not set')
+    engine = create_async_engine(url)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(base.Base.metadata.drop_all)
+            await conn.run_sync(base.Base.metadata.create_all)
+    except OSError as e:
+        await engine.dispose()
+        pytest.skip(f'Postgres is unavailable: {e}')
+    session_maker = sessionmaker(engine, class_=AsyncSession,
+                                 expire_on_commit=False, autoflush=False)
+    async with session_maker() as session:
+        await seed(session, schools=100, classes=2, hotfixes=20)
+    async with engine.connect() as conn:
+        await conn.execute(text('ANALYZE'))
+    yield engine
+    await engine.dispose()
+
+
+@pytest.mark.parametrize('index, query', QUERIES,
+                         ids=[index for index, _ in QUERIES])
+async def test_query_uses_index(engine, index, query):
+    statement = query.compile(dialect=postgresql.dialect(),
+                              compile_kwargs={'literal_binds': True})
+    async with engine.connect() as conn:
+        await conn.execute(text('SET enable_seqscan = off'))
+        plan = '\n'.join(await conn.scalars(text(f'EXPLAIN {statement}')))
+    assert index in plan, plan
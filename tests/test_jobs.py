@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from time_api.services.admission import AdmissionControl, Priority
+from time_api.services.jobs import ImportJobs
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def jobs(redis, monkeypatch):
+    """Очередь, задачи которой выполняются до установки done"""
+    done = asyncio.Event()
+
+    async def run(job, lessons_file):
+        await done.wait()
+
+    jobs = ImportJobs(redis, workers=1, max_jobs=2, ttl=60, retry_after=3)
+    monkeypatch.setattr(jobs, '_run', run)
+    yield jobs
+    done.set()
+    await asyncio.gather(*jobs._tasks)
+
+
+async def test_full_queue_is_rejected(jobs):
+    await jobs.submit(b'', 1)
+    await jobs.submit(b'', 1)
+    with pytest.raises(HTTPException) as e:
+        await jobs.submit(b'', 1)
+    assert e.value.status_code == 503
+    assert e.value.headers == {'Retry-After': '3'}
+
+
+async def test_admission_counts_import_jobs(jobs, monkeypatch):
+    monkeypatch.setattr('time_api.services.admission.import_jobs', jobs)
+    admission = AdmissionControl(None, max_in_flight=100,
+                                 heavy_max_in_flight=2, max_pool_wait=1,
+                                 retry_after=1)
+    await jobs.submit(b'', 1)
+    assert admission.is_admitted(Priority.heavy)
+    await jobs.submit(b'', 1)
+    assert not admission.is_admitted(Priority.heavy)
+    assert admission.is_admitted(Priority.normal)
+
+
+async def test_job_status_requires_teacher(client):
+    response = await client.get('/api/timetable/jobs/unknown')
+    assert response.status_code == 401
+
+
+async def test_failed_job_hides_exception(redis, monkeypatch):
+    async def parse(lessons_file):
+        raise ValueError('column "Время" in /srv/parser.py')
+
+    monkeypatch.setattr('time_api.services.jobs.parse_timetable_async', parse)
+    jobs = ImportJobs(redis, workers=1, max_jobs=2, ttl=60, retry_after=3)
+    job = await jobs.submit(b'', 1)
+    await asyncio.gather(*jobs._tasks)
+    job = await jobs.get(job.job_id)
+    assert job.status == 'failed'
+    assert job.errors == ['Internal error']
+
+
+async def test_finished_job_leaves_memory_when_save_fails(redis, monkeypatch):
+    async def parse(lessons_file):
+        monkeypatch.setattr(jobs, '_save', save)
+        raise ValueError
+
+    async def save(job):
+        raise RuntimeError
+
+    monkeypatch.setattr('time_api.services.jobs.parse_timetable_async', parse)
+    jobs = ImportJobs(redis, workers=1, max_jobs=2, ttl=60, retry_after=3)
+    await jobs.submit(b'', 1)
+    await asyncio.gather(*jobs._tasks, return_exceptions=True)
+    assert jobs._jobs == {}
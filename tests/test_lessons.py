@@ -0,0 +1,120 @@
+import datetime as dt
+
+import pytest
+from fastapi import Response
+
+from time_api.db import tables
+from time_api.db.seed import seed
+from time_api.schemas.teachers import Teacher
+from time_api.services import lessons as lessons_module
+from time_api.services.lessons import LessonService
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize('path', [
+    '/api/lessons?class_id={class_id}',
+    '/api/lessons?class_id={class_id}&do_double=true',
+    '/api/lessons/weekday?class_id={class_id}&weekday=0',
+])
+async def test_lessons_query_count_does_not_grow(
+        session_maker, client, query_count, path):
+    """Учителя загружаются вместе с уроками, а не запросом на урок"""
+    counts = {}
+    for lessons_per_day, weekdays in ((5, 1), (8, 5)):
+        async with session_maker() as session:
+            await seed(session, classes=1, subgroups=1,
+                       lessons_per_day=lessons_per_day, weekdays=weekdays,
+                       random_seed=len(counts))
+        class_id = len(counts) + 1
+        response = await client.get(path.format(class_id=class_id))
+        assert response.status_code == 200
+        counts[lessons_per_day * weekdays] = query_count(response)
+
+    assert counts[5] == counts[40]
+
+
+def make_lesson(lesson_id: int, name: str, hour: int, weekday: int = 0,
+                week: int | None = None) -> dict:
+    return dict(lesson_id=lesson_id, name=name, weekday=weekday, week=week,
+                start_time={'hour': hour, 'minute': 0},
+                end_time={'hour': hour, 'minute': 40},
+                room='20', school_id=1,
+                teacher=Teacher(teacher_id=1, name='Учитель'))
+
+
+def double_lessons(lessons: list[dict]) -> list[tuple[str, list[int]]]:
+    service = LessonService(session=None, response=None)
+    return [(lesson['name'], lesson['lesson_id'])
+            for lesson in service._double_lessons(lessons)]
+
+
+def test_double_lessons_merges_runs_of_any_length():
+    lessons = [make_lesson(1, 'алгебра', 8), make_lesson(2, 'алгебра', 9),
+               make_lesson(3, 'алгебра', 10), make_lesson(4, 'физика', 11)]
+    assert double_lessons(lessons) == [('алгебра', [1, 2, 3]),
+                                       ('физика', [4])]
+
+
+def test_double_lessons_collapses_subgroup_duplicates():
+    """Урок всего класса приходит по разу на подгруппу"""
+    lessons = [make_lesson(11, 'алгебра', 8), make_lesson(11, 'алгебра', 8),
+               make_lesson(12, 'алгебра', 9), make_lesson(12, 'алгебра', 9)]
+    assert double_lessons(lessons) == [('алгебра', [11, 12])]
+    assert double_lessons(lessons[:2]) == [('алгебра', [11])]
+
+
+def test_double_lessons_groups_by_day_in_week_order():
+    """Уроки недели в порядке времени: дни перемешаны, но объединяются
+    только уроки одного дня и одной недели"""
+    lessons = [make_lesson(1, 'алгебра', 8, weekday=0),
+               make_lesson(2, 'алгебра', 8, weekday=1),
+               make_lesson(3, 'алгебра', 9, weekday=0),
+               make_lesson(4, 'физика', 9, weekday=1),
+               make_lesson(5, 'алгебра', 10, weekday=0, week=1),
+               make_lesson(6, 'алгебра', 10, weekday=1)]
+    assert double_lessons(lessons) == [('алгебра', [1, 3]),
+                                       ('алгебра', [2]),
+                                       ('физика', [4]),
+                                       ('алгебра', [5]),
+                                       ('алгебра', [6])]
+
+
+async def test_nearest_day_skips_cancelled_school_day(session_maker, redis):
+    """День, отменённый для всей школы, пропускается"""
+    async with session_maker() as session:
+        await seed(session, classes=1, weekdays=7)
+        tomorrow = dt.date.today() + dt.timedelta(days=1)
+        session.add(tables.LessonHotfix(school_id=1, is_existing=False,
+                                        for_date=tomorrow))
+        await session.commit()
+
+    async with session_maker() as session:
+        service = LessonService(session, Response())
+        lessons = await service.get_nearest_list(
+            class_id=1, weekday=tomorrow.weekday()
+        )
+    assert {lesson.weekday for lesson in lessons.lessons} \
+        == {(tomorrow.weekday() + 1) % 7}
+
+
+@pytest.mark.parametrize('now, weekday', [
+    (dt.datetime(2024, 1, 1, 7), 0),
+    (dt.datetime(2024, 1, 1, 23), 1),
+    # Суббота после уроков: воскресенье без уроков, затем понедельник
+    (dt.datetime(2024, 1, 6, 23), 0),
+])
+async def test_today_list_is_next_day_with_lessons(
+        session_maker, redis, monkeypatch, now, weekday):
+    class FrozenDatetime(dt.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now
+
+    monkeypatch.setattr(lessons_module.dt, 'datetime', FrozenDatetime)
+    async with session_maker() as session:
+        await seed(session, classes=1, weekdays=6)
+        service = LessonService(session, Response())
+        result = await service.get_today_list(class_id=1)
+    assert {lesson.weekday for lesson in result.lessons} == {weekday}
@@ -0,0 +1,36 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pytest
+
+from time_api.services import parser
+from time_api.services.parser import process_by_days
+
+
+def make_frame(rows: list[list]) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=['WeekDay', 'Time', 'Unnamed: 2',
+                                       'Unnamed: 3'])
+
+
+def test_rows_without_lessons_are_not_parsed():
+    """Время и день недели разбираются только в строках с уроками"""
+    df = make_frame([
+        ['Понедельник', 'время', '10а', '10б'],
+        ['Понедельник', '8.30-9.10', 'физика 20', None],
+        ['Понедельник', 'примечание', None, None],
+        ['Понедельник', '9.20-10.00', None, 'химия 21'],
+    ])
+    lessons = process_by_days(df)
+    assert len(lessons) == 4
+    assert set(lessons['name']) == {'физика', 'химия'}
+    assert set(lessons['weekday']) == {0}
+
+
+def test_shutdown_stops_parser_processes():
+    parser._executor = ProcessPoolExecutor(max_workers=1)
+    executor = parser._executor
+    assert executor.submit(sum, [1, 2]).result() == 3
+    parser.shutdown_parser()
+    assert parser._executor is None
+    with pytest.raises(RuntimeError):
+        executor.submit(sum, [1, 2])
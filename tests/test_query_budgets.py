@@ -0,0 +1,40 @@
+import pytest
+
+from time_api.db.seed import seed
+from time_api.services.queries import QUERY_BUDGETS
+
+
+pytestmark = pytest.mark.anyio
+
+PATHS = {
+    'GET /api': '/api',
+    'GET /api/schools': '/api/schools',
+    'GET /api/schools/{school_id}': '/api/schools/1',
+    'GET /api/classes': '/api/classes?school_id=1',
+    'GET /api/classes/{class_id}': '/api/classes/1',
+    'GET /api/subgroups': '/api/subgroups?school_id=1',
+    'GET /api/subgroups/{subgroup_id}': '/api/subgroups/1',
+    'GET /api/teachers': '/api/teachers',
+    'GET /api/teachers/{teacher_id}': '/api/teachers/1',
+    'GET /api/semesters': '/api/semesters?school_id=1',
+    'GET /api/semesters/current': '/api/semesters/current',
+    'GET /api/semesters/{semester_id}': '/api/semesters/1',
+    'GET /api/lessons': '/api/lessons?class_id=1',
+    'GET /api/lessons/today': '/api/lessons/today?class_id=1',
+    'GET /api/lessons/weekday': '/api/lessons/weekday?class_id=1&weekday=0',
+    'GET /api/lessons/nearest_day': '/api/lessons/nearest_day?class_id=1',
+}
+
+
+def test_every_budget_is_checked():
+    assert PATHS.keys() == QUERY_BUDGETS.keys()
+
+
+@pytest.mark.parametrize('route', list(QUERY_BUDGETS))
+async def test_route_query_count(session_maker, client, query_count, route):
+    """Число запросов маршрута с холодными кэшами равно его бюджету"""
+    async with session_maker() as session:
+        await seed(session, classes=3, hotfixes=20)
+    response = await client.get(PATHS[route])
+    assert response.status_code == 200, response.text
+    assert query_count(response) == QUERY_BUDGETS[route]
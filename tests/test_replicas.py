@@ -0,0 +1,48 @@
+import itertools
+
+import pytest
+from fastapi import Request
+from fastapi.routing import APIRoute
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from time_api.db import base
+from time_api.db.base import requires_primary
+from time_api.main import app
+
+
+def get_route(path: str) -> APIRoute:
+    return next(route for route in app.routes
+                if isinstance(route, APIRoute) and route.path == path
+                and 'GET' in route.methods)
+
+
+@pytest.mark.parametrize('path, primary', [
+    ('/api/classes', True),
+    ('/api/semesters/current', True),
+    ('/api/lessons', True),
+    ('/api/lessons/nearest_day', True),
+    ('/api/schools', False),
+    ('/api/teachers', False),
+])
+def test_versioned_routes_read_primary(path, primary):
+    """Ответ с ETag или из кэша ответов помечен версией из Redis, поэтому
+    не читается с отстающей реплики"""
+    assert requires_primary(get_route(path)) is primary
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('path, replica', [
+    ('/api/classes', False),
+    ('/api/schools', True),
+])
+async def test_get_session_routes_to_replica(monkeypatch, path, replica):
+    engine = create_async_engine('sqlite+aiosqlite://')
+    monkeypatch.setattr(base, 'replica_engines', [engine])
+    monkeypatch.setattr(base, '_replicas', itertools.cycle([engine]))
+    request = Request({'type': 'http', 'method': 'GET', 'headers': [],
+                       'route': get_route(path)})
+    sessions = base.get_session(request)
+    session = await sessions.__anext__()
+    assert base.is_replica(session) is replica
+    await sessions.aclose()
+    await engine.dispose()
@@ -0,0 +1,98 @@
+import datetime as dt
+
+import pytest
+from fastapi import Response
+from sqlalchemy import select
+
+from time_api.db import tables
+from time_api.services.cache import schedule_version
+from time_api.services.parser import TimetableService
+
+
+pytestmark = pytest.mark.anyio
+
+
+def make_lesson(name: str, week: int = 0, teacher_id: int = 1) -> dict:
+    return dict(class_number='10', class_letter='А', subgroup='1',
+                name=name, teacher_id=teacher_id, week=week, weekday=0,
+                start_hour=8, start_minute=0, end_hour=8, end_minute=40,
+                room='20', required=True, teacher='')
+
+
+async def import_lessons(session_maker, lessons: list[dict],
+                         subgroup_names: list[str] = ['1']):
+    data = dict(class_numbers=['10'], class_letters=['А'],
+                subgroup_names=subgroup_names, lessons=lessons)
+    async with session_maker() as session:
+        service = TimetableService(session, Response())
+        await service.create_classes(data, 1)
+        return await service.create(lessons, 1)
+
+
+@pytest.fixture
+async def school(postgres_session_maker, redis):
+    async with postgres_session_maker() as session:
+        session.add_all([
+            tables.School(name='Лицей', address='Адрес',
+                          is_using_double_week=False),
+            tables.Teacher(name='Учитель'),
+        ])
+        await session.commit()
+    await import_lessons(postgres_session_maker, [make_lesson('алгебра')])
+    async with postgres_session_maker() as session:
+        session.add(tables.LessonHotfix(lesson_id=1, is_existing=False,
+                                        for_date=dt.date.today()))
+        await session.commit()
+    return postgres_session_maker
+
+
+async def get_hotfix_lesson_ids(session_maker) -> list[int]:
+    async with session_maker() as session:
+        return list(await session.scalars(
+            select(tables.LessonHotfix.lesson_id)
+        ))
+
+
+async def test_replaced_lesson_drops_hotfixes(school):
+    """Отмена алгебры не должна отменять физику, поставленную на её место"""
+    diff = await import_lessons(school, [make_lesson('физика')])
+    assert [lesson.lesson_id for lesson in diff.changed] == [1]
+    assert await get_hotfix_lesson_ids(school) == []
+
+
+async def test_week_change_keeps_hotfixes(school):
+    diff = await import_lessons(school, [make_lesson('алгебра', week=1)])
+    assert [lesson.lesson_id for lesson in diff.changed] == [1]
+    assert await get_hotfix_lesson_ids(school) == [1]
+
+
+async def test_new_subgroup_bumps_version(school):
+    """Список подгрупп меняется и без изменения уроков"""
+    version = await schedule_version.get(1)
+    diff = await import_lessons(school, [make_lesson('алгебра')])
+    assert not (diff.added or diff.removed or diff.changed)
+    assert await schedule_version.get(1) == version
+    await import_lessons(school, [make_lesson('алгебра')], ['1', '2'])
+    assert await schedule_version.get(1) != version
+
+
+async def test_lesson_created_concurrently_is_reused(school):
+    """Урок с тем же ключом, созданный во время загрузки, не ломает её"""
+    async with school() as session:
+        service = TimetableService(session, Response())
+        diff, _ = service._get_diff(
+            await service._get_file_lessons(
+                [make_lesson('алгебра'), make_lesson('физика', teacher_id=1)
+                 | {'start_hour': 9, 'end_hour': 9}], 1
+            ),
+            await service._get_current_lessons(1)
+        )
+        async with school() as other_session:
+            other_session.add(tables.Lesson(
+                name='физика', start_time=dt.time(9), end_time=dt.time(9, 40),
+                weekday=0, room='20', teacher_id=1, school_id=1
+            ))
+            await other_session.commit()
+        await service._apply_diff(diff, 1, set())
+        await session.commit()
+    assert [lesson.lesson_id for lesson in diff.added] == [2]
@@ -1,5 +1,5 @@
 from . import (
         classes, lessons, schools, auth,
         subgroups, teachers, root, semesters,
-        timetable
+        timetable, metrics, debug
 )
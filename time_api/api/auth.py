@@ -27,8 +27,9 @@ async def register(
         raise HTTPException(status_code=401)
     await user_service.create(user_schema=user)
     return schemas.auth.Token(
-            key=authenticate.create_token(name=user.name, password=user.password,
-                access_level=user.access_level)
+            key=await authenticate.create_token(name=user.name, password=user.password,
+                access_level=user.access_level, class_id=user.class_id,
+                teacher_id=user.teacher_id)
         )
 
 
@@ -40,8 +41,9 @@ async def login(user: schemas.auth.User, user_service=Depends(UserService)):
     data = await user_service.get(name=user.name)
     user_data = schemas.auth.UserInfo.from_orm(data)
     user_data.token = schemas.auth.Token(
-            key=authenticate.create_token(name=user.name, password=user.password,
-                access_level=user_data.access_level)
+            key=await authenticate.create_token(name=user.name, password=user.password,
+                access_level=user_data.access_level, class_id=data.class_id,
+                teacher_id=data.teacher_id)
     )
     if data.password == user.password:
         return user_data 
@@ -54,7 +56,7 @@ async def login(user: schemas.auth.User, user_service=Depends(UserService)):
 )
 async def refresh(token: schemas.auth.Token):
     return schemas.auth.Token(
-            key=authenticate.refresh_token(token_key=token.key)
+            key=await authenticate.refresh_token(token_key=token.key)
     )
 
 
@@ -67,7 +69,7 @@ async def get_user_info(
         token: str | None = None,
         service: UserService = Depends(UserService)
     ):
-    name = authenticate.get_info_by_token(token)['name']
+    name = (await authenticate.get_info_by_token(token))['name']
     user = await service.get(name)
     print(user)
     return user
@@ -6,6 +6,7 @@ from fastapi import APIRouter, Depends
 from time_api import schemas
 from time_api.services.classes import ClassService
 from time_api.services.auth import authenticate
+from time_api.services.cache import schedule_etag
 
 
 logger = logging.getLogger(__name__)
@@ -21,6 +22,7 @@ router = APIRouter(
 )
 async def get_classes(
         school_id: Optional[int] = None,
+        _=Depends(schedule_etag),
         service: ClassService = Depends(ClassService)
 ):
     return await service.get_list(school_id)
@@ -51,6 +53,7 @@ async def create_class(
 )
 async def get_class(
         class_id: int,
+        _=Depends(schedule_etag),
         service: ClassService = Depends(ClassService)
 ):
     return await service.get(class_id=class_id)
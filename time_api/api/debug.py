@@ -0,0 +1,51 @@
+import logging
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse
+
+from time_api import schemas
+from time_api.services.auth import authenticate
+from time_api.services.profiler import profiler
+from time_api.services.queries import slow_queries
+
+
+logger = logging.getLogger(__name__)
+router = APIRouter(
+    prefix='/api/debug',
+    tags=['Debug'],
+)
+
+
+@router.get(
+    '/slow_queries',
+    response_model=schemas.debug.SlowQueryList,
+    description="Need Admin level"
+)
+async def get_slow_queries(_=Depends(authenticate.admin())):
+    return schemas.debug.SlowQueryList(queries=[
+        schemas.debug.SlowQuery(
+            statement=query.statement,
+            parameters=repr(query.parameters),
+            duration=query.duration,
+            caller=query.caller,
+            plan=query.plan,
+            created_at=query.created_at
+        ) for query in reversed(slow_queries)
+    ])
+
+
+@router.post(
+    '/profile',
+    response_class=PlainTextResponse,
+    description="""
+        Need Admin level. Samples the worker which received this request for
+        duration seconds, or until requests more requests are finished but
+        no longer than duration. Returns folded stacks for flame graphs
+    """
+)
+async def profile(
+        duration: float = Query(10, gt=0, le=300),
+        requests: int | None = Query(None, gt=0),
+        _=Depends(authenticate.admin())
+):
+    return await profiler.profile(duration, requests)
@@ -7,6 +7,9 @@ from time_api import schemas
 from time_api.services.lessons import LessonService
 from time_api.services.lessons_hotfix import LessonHotfixService
 from time_api.services.auth import authenticate, AccessLevel 
+from time_api.services.cache import (
+    response_cache, schedule_etag, timed_schedule_etag
+)
 
 router = APIRouter(
     prefix='/api/lessons',
@@ -29,14 +32,26 @@ async def get_lessons(
         teacher_id: int | None = None,
         weekday: Optional[int] = None,
         do_double: Optional[bool] = False,
+        etag: str | None = Depends(schedule_etag),
         service: LessonService = Depends(LessonService)
 ):
-    return await service.get_list(
-        class_id=class_id,
-        weekday=weekday,
-        subgroup_id=subgroup_id,
-        do_double=do_double,
-        teacher_id=teacher_id
+    return await response_cache.get_or_compute(
+        'lessons',
+        dict(subgroup_id=subgroup_id, class_id=class_id,
+             teacher_id=teacher_id, weekday=weekday, do_double=do_double),
+        school_ids=await service.get_school_ids(
+            class_id=class_id,
+            subgroup_id=subgroup_id,
+            teacher_id=teacher_id
+        ),
+        compute=lambda: service.get_list(
+            class_id=class_id,
+            weekday=weekday,
+            subgroup_id=subgroup_id,
+            do_double=do_double,
+            teacher_id=teacher_id
+        ),
+        etag=etag
     )
 
 
@@ -48,6 +63,7 @@ async def get_lessons(
 async def get_today_lessons(
         subgroup_id: Optional[int] = None,
         class_id: Optional[int] = None,
+        _=Depends(timed_schedule_etag),
         service: LessonService = Depends(LessonService)
 ):
     return await service.get_today_list(
@@ -65,6 +81,7 @@ async def get_weekday_lessons(
         weekday: Optional[int] = None,
         subgroup_id: Optional[int] = None,
         class_id: Optional[int] = None,
+        _=Depends(schedule_etag),
         service: LessonService = Depends(LessonService)
 ):
     return await service.get_weekday_list(
@@ -86,13 +103,25 @@ async def get_nearest_lessons(
         class_id: Optional[int] = None,
         teacher_id: int | None = None,
         do_double: bool = False,
+        etag: str | None = Depends(timed_schedule_etag),
         service: LessonService = Depends(LessonService)
 ):
-    return await service.get_nearest_list(
-        class_id=class_id,
-        subgroup_id=subgroup_id,
-        do_double=do_double,
-        teacher_id=teacher_id
+    return await response_cache.get_or_compute(
+        'nearest_day',
+        dict(subgroup_id=subgroup_id, class_id=class_id,
+             teacher_id=teacher_id, do_double=do_double),
+        school_ids=await service.get_school_ids(
+            class_id=class_id,
+            subgroup_id=subgroup_id,
+            teacher_id=teacher_id
+        ),
+        compute=lambda: service.get_nearest_list(
+            class_id=class_id,
+            subgroup_id=subgroup_id,
+            do_double=do_double,
+            teacher_id=teacher_id
+        ),
+        etag=etag
     )
 
 
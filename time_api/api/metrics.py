@@ -0,0 +1,18 @@
+import logging
+
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from time_api.services.metrics import get_metrics
+
+
+logger = logging.getLogger(__name__)
+router = APIRouter(
+    prefix='/api/metrics',
+    tags=['Metrics'],
+)
+
+
+@router.get('')
+async def get_prometheus_metrics():
+    return Response(content=get_metrics(), media_type=CONTENT_TYPE_LATEST)
@@ -5,6 +5,7 @@ from fastapi import APIRouter, Depends
 from time_api import schemas
 from time_api.services.semesters import SemesterService
 from time_api.services.auth import authenticate
+from time_api.services.cache import response_cache, schedule_etag
 
 logger = logging.getLogger(__name__)
 router = APIRouter(
@@ -18,6 +19,7 @@ router = APIRouter(
     response_model=schemas.semesters.SemesterList
 )
 async def get_semesters(
+        _=Depends(schedule_etag),
         service: SemesterService = Depends(SemesterService)
 ):
     return await service.get_list()
@@ -28,9 +30,15 @@ async def get_semesters(
     response_model=schemas.semesters.CurrentSemester
 )
 async def get_current_semester(
+        etag: str | None = Depends(schedule_etag),
         service: SemesterService = Depends(SemesterService)
 ):
-    return await service.get_current()
+    return await response_cache.get_or_compute(
+        'current_semester', {},
+        school_ids=[],
+        compute=service.get_current,
+        etag=etag
+    )
 
 
 @router.get(
@@ -39,6 +47,7 @@ async def get_current_semester(
 )
 async def get_semester(
         semester_id: int,
+        _=Depends(schedule_etag),
         service: SemesterService = Depends(SemesterService)
 ):
     return await service.get(semester_id=semester_id)
@@ -6,6 +6,7 @@ from fastapi import APIRouter, Depends
 from time_api import schemas
 from time_api.services.subgroups import SubgroupService
 from time_api.services.auth import authenticate
+from time_api.services.cache import schedule_etag
 
 
 logger = logging.getLogger(__name__)
@@ -22,6 +23,7 @@ router = APIRouter(
 async def get_subgroups(
         school_id: Optional[int] = None,
         class_id: Optional[int] = None,
+        _=Depends(schedule_etag),
         service: SubgroupService = Depends(SubgroupService)
 ):
     return await service.get_list(
@@ -55,6 +57,7 @@ async def create_subgroup(
 )
 async def get_subgroup(
         subgroup_id: int,
+        _=Depends(schedule_etag),
         service: SubgroupService = Depends(SubgroupService)
 ):
     return await service.get(subgroup_id=subgroup_id)
@@ -4,10 +4,9 @@ from fastapi import APIRouter, Depends, UploadFile
 
 from time_api import schemas
 from time_api.services.auth import authenticate
-from time_api.services.parser import get_lessons_list, get_timetable_data
+from time_api.services.parser import parse_timetable_async
 from time_api.services.parser import TimetableService
-from time_api.services.classes import ClassService
-from time_api.services.subgroups import SubgroupService
+from time_api.services.jobs import import_jobs
 
 
 logger = logging.getLogger(__name__)
@@ -19,32 +18,49 @@ router = APIRouter(
 
 @router.post(
     '',
-    status_code=201
+    status_code=202,
+    response_model=schemas.timetable.ImportJob,
+    description="""
+        Queue timetable import. Returns job, its state is available
+        at /api/timetable/jobs/{job_id}
+    """
 )
 async def create_lessons(
+        lessons_file: UploadFile,
+        school_id: int,
+        _=Depends(authenticate.teacher())
+):
+    return await import_jobs.submit(await lessons_file.read(), school_id)
+
+
+@router.post(
+    '/diff',
+    response_model=schemas.timetable.TimetableDiff,
+    description="""
+        Dry run of timetable import. Returns lessons which would be added,
+        removed or changed, nothing is saved
+    """
+)
+async def get_timetable_diff(
         lessons_file: UploadFile,
         school_id: int,
         _=Depends(authenticate.teacher()),
-        service=Depends(TimetableService),
-        class_service=Depends(ClassService),
-        subgroup_service=Depends(SubgroupService)
+        service=Depends(TimetableService)
+):
+    data = await parse_timetable_async(await lessons_file.read())
+    await service.create_classes(data, school_id)
+    return await service.create(data['lessons'], school_id, dry_run=True)
+
+
+@router.get(
+    '/jobs/{job_id}',
+    response_model=schemas.timetable.ImportJob
+)
+async def get_import_job(
+        job_id: str,
+        _=Depends(authenticate.teacher())
 ):
-    lessons_file = lessons_file.file.read()
-    data = get_timetable_data(lessons_file)
-    for class_number in data['class_numbers']:
-        for class_letter in data['class_letters']:
-            class_id = (await class_service.create(schemas.classes.ClassCreate(
-                number=int(class_number),
-                letter=class_letter,
-                school_id=school_id
-            ))).class_id
-            for subgroup_name in data['subgroup_names']:
-                s = await subgroup_service.create(schemas.subgroups.SubgroupCreate(
-                        name=subgroup_name,
-                        class_id=class_id
-                ))
-    lessons_list = get_lessons_list(lessons_file)
-    return await service.create(lessons_list, school_id)
+    return await import_jobs.get(job_id)
 
 
 @router.patch(
@@ -57,6 +73,5 @@ async def hotfix_lesons(
         _=Depends(authenticate.teacher()),
         service=Depends(TimetableService),
 ):
-    lessons_file = lessons_file.file.read()
-    lessons_list = get_lessons_list(lessons_file)
-    return await service.hotfix(lessons_list, school_id)
+    data = await parse_timetable_async(await lessons_file.read())
+    return await service.hotfix(data['lessons'], school_id)
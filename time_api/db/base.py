@@ -1,9 +1,13 @@
 import asyncio
+import itertools
 import logging
+import time
 
+from fastapi import Request
 from sqlalchemy import MetaData
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -18,12 +22,10 @@ DATABASE_URL = f'postgresql+asyncpg://' \
                f'@{settings.postgres_host}/{settings.postgres_db}'
 
 
-engine = create_async_engine(
-    DATABASE_URL,
-    pool_size=4,
-    max_overflow=0,
-    pool_reset_on_return=True
-)
+engine: AsyncEngine | None = None
+replica_engines: list[AsyncEngine] = []
+_replicas = itertools.cycle(replica_engines)
+_primary_routes: dict = {}
 convention = {
     "ix": "ix_%(column_0_label)s",
     "uq": "uq_%(table_name)s_%(column_0_name)s",
@@ -34,7 +36,7 @@ convention = {
 metadata = MetaData(naming_convention=convention)
 Base = declarative_base(metadata=metadata)
 async_session = sessionmaker(
-    engine, class_=AsyncSession,
+    class_=AsyncSession,
     expire_on_commit=False,
     autoflush=False,
     autocommit=False
@@ -43,11 +45,83 @@ async_session = sessionmaker(
 from .tables import *
 
 
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, измеряющий время ожидания свободного соединения.
+
+    wait - экспоненциальное среднее ожидания, затухающее вдвое за
+    WAIT_HALF_LIFE секунд без новых замеров"""
+    WAIT_HALF_LIFE = 1.0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait = 0.0
+        self._wait_at = time.monotonic()
+
+    @property
+    def wait(self) -> float:
+        elapsed = time.monotonic() - self._wait_at
+        return self._wait * 0.5 ** (elapsed / self.WAIT_HALF_LIFE)
+
+    def _do_get(self):
+        started = time.monotonic()
+        try:
+            return super()._do_get()
+        finally:
+            now = time.monotonic()
+            self._wait = (self.wait + now - started) / 2
+            self._wait_at = now
+
+
+def create_engine(url: str = DATABASE_URL) -> AsyncEngine:
+    """Движок с пулом из настроек. Каждый процесс gunicorn держит до
+    db_pool_size + db_max_overflow соединений"""
+    return create_async_engine(
+        url,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        pool_reset_on_return=True,
+        poolclass=TimedQueuePool,
+        connect_args={
+            'statement_cache_size': settings.db_statement_cache_size
+        }
+    )
+
+
+async def init_engine():
+    """Создание движка при запуске процесса, а не при импорте, чтобы
+    процессы не делили пул"""
+    global engine, _replicas
+    if engine is None:
+        engine = create_engine()
+        async_session.configure(bind=engine)
+        replica_engines[:] = [create_engine(url) for url
+                              in settings.postgres_replica_urls]
+        _replicas = itertools.cycle(replica_engines)
+        logger.info(f'DB pool: size={settings.db_pool_size}, '
+                    f'max_overflow={settings.db_max_overflow}, '
+                    f'replicas={len(replica_engines)}')
+
+
+async def dispose_engine():
+    global engine
+    if engine is not None:
+        await engine.dispose()
+        engine = None
+    for replica_engine in replica_engines:
+        await replica_engine.dispose()
+    replica_engines.clear()
+
+
 async def init_models():
+    await init_engine()
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
     logger.info('Models initialisation is done')
+    await dispose_engine()
 
 
 def run_init_models():
@@ -55,8 +129,46 @@ def run_init_models():
     print("Done")
 
 
-async def get_session() -> AsyncSession:
-    session: AsyncSession = async_session()
+def get_pool_wait() -> float:
+    """Наибольшее среднее ожидание соединения среди пулов процесса"""
+    return max([engine_.pool.wait for engine_ in [engine, *replica_engines]
+                if engine_ is not None], default=0.0)
+
+
+def is_replica(session: AsyncSession) -> bool:
+    return session.info.get('replica', False)
+
+
+def requires_primary(route) -> bool:
+    """Есть ли у маршрута зависимость с атрибутом requires_primary.
+    Так отмечены зависимости, помечающие ответ версией расписания из
+    Redis: ответ с отстающей реплики получил бы версию, которой не
+    соответствует"""
+    endpoint = getattr(route, 'endpoint', None)
+    if endpoint not in _primary_routes:
+        dependants = list(route.dependant.dependencies) \
+            if hasattr(route, 'dependant') else []
+        found = False
+        while dependants:
+            dependant = dependants.pop()
+            if getattr(dependant.call, 'requires_primary', False):
+                found = True
+                break
+            dependants.extend(dependant.dependencies)
+        _primary_routes[endpoint] = found
+    return _primary_routes[endpoint]
+
+
+async def get_session(request: Request) -> AsyncSession:
+    """Сессия запроса. GET запросы при заданных репликах читают с них
+    по очереди, кроме маршрутов с ETag и кэшем ответов (requires_primary),
+    остальные идут в основную базу"""
+    if request.method in ('GET', 'HEAD') and replica_engines \
+            and not requires_primary(request.scope.get('route')):
+        session: AsyncSession = async_session(bind=next(_replicas),
+                                              info={'replica': True})
+    else:
+        session: AsyncSession = async_session()
     try:
         yield session
     finally:
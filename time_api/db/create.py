@@ -10,6 +10,38 @@ class Settings(BaseSettings):
     postgres_db = 'db'
     postgres_password = 'password'
     postgres_user = 'postgres'
+    postgres_replica_urls: list[str] = []
+    db_pool_size = 4
+    db_max_overflow = 0
+    db_pool_timeout = 30.0
+    db_pool_recycle = -1
+    db_pool_pre_ping = False
+    db_statement_cache_size = 100
+    workers = 1
+    admission_max_in_flight = 256
+    admission_heavy_max_in_flight = 2
+    admission_max_pool_wait = 0.5
+    admission_retry_after = 1
+    debug = False
+    query_budget = 20
+    slow_query_threshold = 0.5
+    slow_query_explain = False
+    slow_query_log_file: str | None = None
+    profiler_interval = 0.005
+    redis_host = 'redis'
+    redis_max_connections = 64
+    redis_pool_timeout = 1.0
+    auth_cache_size = 0
+    auth_cache_ttl = 5.0
+    auth_secret: str | None = None
+    auth_revocation_refresh = 5.0
+    timetable_cache_ttl = 300
+    response_cache_ttl = 60
+    response_cache_lock_timeout = 5.0
+    parser_workers = 1
+    import_workers = 1
+    import_max_jobs = 4
+    import_job_ttl = 24 * 60 * 60
 
 
 settings = Settings()
@@ -0,0 +1,146 @@
+"""Синтетические школы для бенчмарков и ручной проверки.
+
+    seed_db --schools 2 --classes 12 --subgroups 2 --lessons 7 --hotfixes 20
+"""
+import argparse
+import asyncio
+import datetime as dt
+import logging
+import random
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import base
+from . import tables
+
+
+logger = logging.getLogger(__name__)
+
+
+LESSON_NAMES = ['алгебра', 'геометрия', 'русский язык', 'литература',
+                'физика', 'химия', 'биология', 'история', 'география',
+                'английский язык', 'информатика', 'физическая культура']
+LETTERS = 'абвгдежз'
+
+
+async def seed(
+        session: AsyncSession,
+        schools: int = 1,
+        classes: int = 12,
+        subgroups: int = 2,
+        lessons_per_day: int = 7,
+        hotfixes: int = 0,
+        weekdays: int = 6,
+        random_seed: int = 0
+) -> list[int]:
+    """Школы с семестром, классами, подгруппами, учителями, полной неделей
+    уроков и заменами. Часть уроков идёт у всего класса, часть - отдельно
+    у каждой подгруппы. Возвращает school_id созданных школ"""
+    rnd = random.Random(random_seed)
+    today = dt.date.today()
+    school_ids = []
+    for school_number in range(schools):
+        school = tables.School(name=f'Школа {school_number + 1}',
+                               address=f'Синтетическая, {rnd.randrange(1000)}',
+                               is_using_double_week=False)
+        session.add(school)
+        await session.flush()
+        school_ids.append(school.school_id)
+        session.add(tables.Semester(
+            school_id=school.school_id,
+            start_date=today - dt.timedelta(days=60),
+            end_date=today + dt.timedelta(days=120)
+        ))
+
+        teachers = [tables.Teacher(name=f'Учитель {school_number + 1}.{i + 1}')
+                    for i in range(max(classes, len(LESSON_NAMES)))]
+        school_classes = [
+            tables.Class(school_id=school.school_id, number=5 + i % 7,
+                         letter=LETTERS[i // 7 % len(LETTERS)] + 'x' * (i // 56))
+            for i in range(classes)
+        ]
+        session.add_all(teachers + school_classes)
+        await session.flush()
+        class_subgroups = [
+            [tables.Subgroup(class_id=school_class.class_id, name=str(i + 1))
+             for i in range(subgroups)]
+            for school_class in school_classes
+        ]
+        session.add_all([subgroup for items in class_subgroups
+                         for subgroup in items])
+        await session.flush()
+
+        lessons = []
+        links = []
+        for class_number, items in enumerate(class_subgroups):
+            for weekday in range(weekdays):
+                for n in range(lessons_per_day):
+                    start = dt.datetime(2000, 1, 1, 8) \
+                        + dt.timedelta(minutes=50 * n)
+                    parts = [items] if (weekday + n) % 3 else \
+                        [[subgroup] for subgroup in items]
+                    for part_number, part in enumerate(parts):
+                        lesson = tables.Lesson(
+                            name=LESSON_NAMES[
+                                (class_number + weekday + n)
+                                % len(LESSON_NAMES)],
+                            start_time=start.time(),
+                            end_time=(start + dt.timedelta(minutes=40)).time(),
+                            weekday=weekday,
+                            room=f'{100 + class_number}'
+                                 + (f'/{part_number + 1}'
+                                    if len(parts) > 1 else ''),
+                            teacher_id=teachers[
+                                (class_number + n + part_number)
+                                % len(teachers)].teacher_id,
+                            school_id=school.school_id
+                        )
+                        lessons.append(lesson)
+                        links.append((lesson, part))
+        session.add_all(lessons)
+        await session.flush()
+        session.add_all([
+            tables.LessonSubgroup(lesson_id=lesson.lesson_id,
+                                  subgroup_id=subgroup.subgroup_id)
+            for lesson, part in links for subgroup in part
+        ])
+
+        for lesson in rnd.sample(lessons, min(hotfixes, len(lessons))):
+            for_date = today + dt.timedelta(
+                days=(lesson.weekday - today.weekday()) % 7
+            )
+            is_existing = rnd.random() < 0.5
+            session.add(tables.LessonHotfix(
+                lesson_id=lesson.lesson_id,
+                room=f'{lesson.room}a' if is_existing else None,
+                is_existing=is_existing,
+                for_date=for_date,
+                school_id=school.school_id
+            ))
+        await session.commit()
+        logger.info(f'School {school.school_id}: {classes} classes, '
+                    f'{len(lessons)} lessons')
+    return school_ids
+
+
+async def seed_db(**kwargs):
+    await base.init_engine()
+    try:
+        async with base.async_session() as session:
+            school_ids = await seed(session, **kwargs)
+    finally:
+        await base.dispose_engine()
+    print(f'Created schools: {school_ids}')
+
+
+def run_seed():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--schools', type=int, default=1)
+    parser.add_argument('--classes', type=int, default=12)
+    parser.add_argument('--subgroups', type=int, default=2)
+    parser.add_argument('--lessons', type=int, default=7,
+                        dest='lessons_per_day')
+    parser.add_argument('--hotfixes', type=int, default=0)
+    parser.add_argument('--weekdays', type=int, default=6, choices=range(1, 8))
+    parser.add_argument('--seed', type=int, default=0, dest='random_seed')
+    asyncio.run(seed_db(**vars(parser.parse_args())))
@@ -6,6 +6,8 @@ from sqlalchemy import Boolean
 from sqlalchemy import ForeignKey
 from sqlalchemy import UniqueConstraint
 from sqlalchemy import Date
+from sqlalchemy import Index
+from sqlalchemy.orm import relationship
 from .base import Base
 
 
@@ -73,6 +75,9 @@ class Teacher(Base):
                         index=True)
     name = Column(String)
 
+    lessons = relationship('Lesson', back_populates='teacher',
+                           passive_deletes=True)
+
 
 class Lesson(Base):
     __tablename__ = "lessons"
@@ -90,6 +95,9 @@ class Lesson(Base):
     school_id = Column(ForeignKey('schools.school_id', ondelete='CASCADE'),
                        nullable=False)
 
+    teacher = relationship('Teacher', back_populates='lessons',
+                           lazy='joined', innerjoin=True)
+
     __table_args__ = (
         UniqueConstraint(
             'name',
@@ -100,6 +108,10 @@ class Lesson(Base):
             'school_id',
             'teacher_id'
         ),
+        Index('ix_lessons_school_id_weekday_start_time',
+              'school_id', 'weekday', 'start_time'),
+        Index('ix_lessons_teacher_id_weekday_start_time',
+              'teacher_id', 'weekday', 'start_time'),
     )
 
 
@@ -122,6 +134,10 @@ class LessonHotfix(Base):
     for_date = Column(Date, nullable=False)
     school_id = Column(Integer, nullable=True)
 
+    __table_args__ = (
+        Index('ix_lessons_hotfix_for_date_lesson_id', 'for_date', 'lesson_id'),
+    )
+
 
 class LessonSubgroup(Base):
     """Отношение уроков и подгрупп. У какой подгруппы, какие уроки.
@@ -136,6 +152,11 @@ class LessonSubgroup(Base):
         primary_key=True
     )
 
+    __table_args__ = (
+        Index('ix_lesson_subgroups_subgroup_id_lesson_id',
+              'subgroup_id', 'lesson_id'),
+    )
+
 
 class Semester(Base):
     """Время от каникул до каникул.
@@ -156,4 +177,5 @@ class Semester(Base):
             'start_date',
             'end_date'
         ),
+        Index('ix_semesters_end_date_start_date', 'end_date', 'start_date'),
     )
@@ -2,6 +2,14 @@ from fastapi import FastAPI
 
 from time_api import api
 from time_api.description import application_metadata
+from time_api.db.base import init_engine, dispose_engine
+from time_api.db.create import settings
+from time_api.services.admission import AdmissionControl
+from time_api.services.auth import authenticate
+from time_api.services.metrics import MetricsMiddleware
+from time_api.services.parser import shutdown_parser
+from time_api.services.profiler import ProfilerMiddleware
+from time_api.services.queries import QueryCounterMiddleware
 import logging
 
 
@@ -20,6 +28,18 @@ def create_application():
                           redoc_url='/api/redoc',
                           logger=logger,
                           **application_metadata)
+    application.add_middleware(
+        AdmissionControl,
+        max_in_flight=settings.admission_max_in_flight,
+        heavy_max_in_flight=settings.admission_heavy_max_in_flight,
+        max_pool_wait=settings.admission_max_pool_wait,
+        retry_after=settings.admission_retry_after
+    )
+    application.add_middleware(QueryCounterMiddleware,
+                               debug=settings.debug,
+                               budget=settings.query_budget)
+    application.add_middleware(MetricsMiddleware)
+    application.add_middleware(ProfilerMiddleware)
     application.include_router(api.root.router)
     application.include_router(api.schools.router)
     application.include_router(api.classes.router)
@@ -29,6 +49,12 @@ def create_application():
     application.include_router(api.lessons.router)
     application.include_router(api.auth.router)
     application.include_router(api.timetable.router)
+    application.include_router(api.metrics.router)
+    application.include_router(api.debug.router)
+    application.add_event_handler('startup', init_engine)
+    application.add_event_handler('startup', authenticate.create_admin)
+    application.add_event_handler('shutdown', dispose_engine)
+    application.add_event_handler('shutdown', shutdown_parser)
     return application
 
 
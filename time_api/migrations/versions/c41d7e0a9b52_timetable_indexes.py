@@ -0,0 +1,32 @@
+"""timetable indexes
+
+Revision ID: c41d7e0a9b52
+Revises: b6ae9a29d1aa
+Create Date: 2026-10-18 13:30:12.482911
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d7e0a9b52'
+down_revision = 'b6ae9a29d1aa'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_lessons_school_id_weekday_start_time', 'lessons', ['school_id', 'weekday', 'start_time'], unique=False)
+    op.create_index('ix_lessons_teacher_id_weekday_start_time', 'lessons', ['teacher_id', 'weekday', 'start_time'], unique=False)
+    op.create_index('ix_lesson_subgroups_subgroup_id_lesson_id', 'lesson_subgroups', ['subgroup_id', 'lesson_id'], unique=False)
+    op.create_index('ix_lessons_hotfix_for_date_lesson_id', 'lessons_hotfix', ['for_date', 'lesson_id'], unique=False)
+    op.create_index('ix_semesters_end_date_start_date', 'semesters', ['end_date', 'start_date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_semesters_end_date_start_date', table_name='semesters')
+    op.drop_index('ix_lessons_hotfix_for_date_lesson_id', table_name='lessons_hotfix')
+    op.drop_index('ix_lesson_subgroups_subgroup_id_lesson_id', table_name='lesson_subgroups')
+    op.drop_index('ix_lessons_teacher_id_weekday_start_time', table_name='lessons')
+    op.drop_index('ix_lessons_school_id_weekday_start_time', table_name='lessons')
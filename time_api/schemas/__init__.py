@@ -8,5 +8,7 @@ from . import (
     times,
     messages,
     semesters,
-    auth
+    auth,
+    timetable,
+    debug
 )
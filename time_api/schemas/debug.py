@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+
+
+class SlowQuery(BaseModel):
+    """Медленный запрос к БД
+
+    :param duration: длительность в секундах
+    :param caller: метод сервиса, выполнивший запрос
+    :param plan: EXPLAIN (ANALYZE, BUFFERS), если включён"""
+    statement: str
+    parameters: str
+    duration: float
+    caller: str
+    plan: str | None
+    created_at: float
+
+
+class SlowQueryList(BaseModel):
+    queries: list[SlowQuery]
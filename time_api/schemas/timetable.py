@@ -0,0 +1,43 @@
+from pydantic import BaseModel
+
+from .times import Time
+
+
+class TimetableDiffLesson(BaseModel):
+    """Урок в изменениях расписания
+
+    :param lesson_id: пусто у новых уроков"""
+    lesson_id: int | None = None
+    name: str
+    start_time: Time
+    end_time: Time
+    week: int | None = None
+    weekday: int
+    room: str
+    teacher_id: int
+    subgroup_ids: list[int]
+
+
+class TimetableDiff(BaseModel):
+    """Отличия загружаемого файла от расписания школы
+
+    :param changed: уроки в новом виде, сохраняют lesson_id и замены"""
+    added: list[TimetableDiffLesson] = []
+    removed: list[TimetableDiffLesson] = []
+    changed: list[TimetableDiffLesson] = []
+
+
+class ImportJob(BaseModel):
+    """Фоновая загрузка расписания
+
+    :param status: queued, parsing, importing, done или failed
+    :param duration: длительность в секундах"""
+    job_id: str
+    school_id: int
+    status: str = 'queued'
+    parsed_rows: int | None = None
+    added_lessons: int | None = None
+    removed_lessons: int | None = None
+    changed_lessons: int | None = None
+    duration: float | None = None
+    errors: list[str] = []
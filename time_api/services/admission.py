@@ -0,0 +1,85 @@
+import logging
+from enum import IntEnum
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+
+from time_api.db.base import get_pool_wait
+from time_api.services.jobs import import_jobs
+from time_api.services.metrics import admission_rejected
+
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    heavy = 0
+    normal = 1
+    cheap = 2
+
+
+class AdmissionControl:
+    """ASGI middleware, отклоняющий запросы с 503 и Retry-After, пока
+    процесс перегружен, вместо ожидания в очереди пула соединений.
+
+    Запросы делятся по приоритету: GET читают из кэшей и пропускаются до
+    max_in_flight одновременных запросов, остальные - до 80% этого числа,
+    загрузка расписания - до половины, и пока запросов загрузки вместе с
+    фоновыми задачами загрузки процесса меньше heavy_max_in_flight.
+    Если среднее ожидание соединения из пула больше max_pool_wait секунд,
+    пропускаются только GET"""
+    HEAVY_PATHS = ('/api/timetable',)
+
+    def __init__(
+            self,
+            app,
+            max_in_flight: int,
+            heavy_max_in_flight: int,
+            max_pool_wait: float,
+            retry_after: int
+    ):
+        self.app = app
+        self.max_in_flight = max_in_flight
+        self.heavy_max_in_flight = heavy_max_in_flight
+        self.max_pool_wait = max_pool_wait
+        self.retry_after = retry_after
+        self.in_flight = dict.fromkeys(Priority, 0)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        priority = self.get_priority(scope)
+        if not self.is_admitted(priority):
+            admission_rejected.labels(priority.name).inc()
+            logger.warning(f'Request {scope["method"]} {scope["path"]} '
+                           f'is rejected, in flight: {self.in_flight}')
+            response = JSONResponse(
+                {'detail': 'Service is overloaded'},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(self.retry_after)}
+            )
+            return await response(scope, receive, send)
+        self.in_flight[priority] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight[priority] -= 1
+
+    def get_priority(self, scope) -> Priority:
+        if scope['method'] in ('GET', 'HEAD'):
+            return Priority.cheap
+        if scope['path'].startswith(self.HEAVY_PATHS):
+            return Priority.heavy
+        return Priority.normal
+
+    def is_admitted(self, priority: Priority) -> bool:
+        in_flight = sum(self.in_flight.values())
+        if priority == Priority.cheap:
+            return in_flight < self.max_in_flight
+        if get_pool_wait() > self.max_pool_wait:
+            return False
+        if priority == Priority.normal:
+            return in_flight < self.max_in_flight * 0.8
+        heavy = self.in_flight[Priority.heavy] + import_jobs.active
+        return (heavy < self.heavy_max_in_flight
+                and in_flight < self.max_in_flight * 0.5)
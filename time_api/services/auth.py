@@ -1,6 +1,13 @@
-from fastapi import Header, HTTPException
+import base64
+import hashlib
+import hmac
+import json
+import time
+from collections import OrderedDict
+from fastapi import Header, HTTPException, status
 from os import environ
-from redis import Redis
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
 from uuid import uuid4
 from enum import IntEnum
 
@@ -11,6 +18,9 @@ from sqlalchemy import select, exc
 from .base import BaseService
 from time_api import schemas
 from time_api.db import tables
+from time_api.db.create import settings
+from time_api.services.cache import redis_connection
+from time_api.services.metrics import cache_requests, redis_latency
 
 
 class AccessLevel(IntEnum):
@@ -46,51 +56,233 @@ class UserService(BaseService):
         return user
 
 
+class TokenCache:
+    """LRU кэш данных токенов в памяти процесса на ttl секунд, но не дольше
+    срока жизни самого токена"""
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._tokens: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    def get(self, token_key: str) -> dict | None:
+        cached = self._tokens.get(token_key)
+        if cached is None or cached[0] <= time.monotonic():
+            self.misses += 1
+            cache_requests.labels('token', 'miss').inc()
+            self._tokens.pop(token_key, None)
+            return None
+        self.hits += 1
+        cache_requests.labels('token', 'hit').inc()
+        self._tokens.move_to_end(token_key)
+        return dict(cached[1])
+
+    def set(self, token_key: str, info: dict, expire: float | None = None):
+        ttl = self.ttl if expire is None else min(self.ttl, expire)
+        self._tokens[token_key] = (time.monotonic() + ttl, dict(info))
+        self._tokens.move_to_end(token_key)
+        while len(self._tokens) > self.size:
+            self._tokens.popitem(last=False)
+
+    def invalidate(self, token_key: str):
+        self._tokens.pop(token_key, None)
+
+
+class SignedTokens:
+    """Подписанные HMAC-SHA256 токены в формате JWT. Проверяются без Redis,
+    в нём хранится только список отозванных токенов.
+
+    Список отозванных токенов перечитывается не чаще раза в refresh секунд,
+    при недоступности Redis используется прежний"""
+    KEY = 'token:revoked'
+    HEADER = {'alg': 'HS256', 'typ': 'JWT'}
+
+    def __init__(self, connection: Redis, secret: str, refresh: float):
+        self.connection = connection
+        self.secret = secret.encode()
+        self.refresh = refresh
+        self._revoked: set[str] = set()
+        self._loaded_at = -refresh
+
+    @staticmethod
+    def is_signed(token_key: str) -> bool:
+        return token_key.count('.') == 2
+
+    def encode(self, claims: dict, expire: int) -> str:
+        payload = claims | {'jti': str(uuid4()),
+                            'exp': int(time.time()) + expire}
+        signing_input = '.'.join(
+            self._b64encode(json.dumps(part, separators=(',', ':')).encode())
+            for part in (self.HEADER, payload)
+        )
+        return f'{signing_input}.{self._sign(signing_input)}'
+
+    async def decode(self, token_key: str) -> dict | None:
+        signing_input, _, signature = token_key.rpartition('.')
+        # compare_digest принимает str только из ASCII символов
+        if not hmac.compare_digest(signature.encode(),
+                                   self._sign(signing_input).encode()):
+            return None
+        try:
+            payload = json.loads(
+                self._b64decode(signing_input.partition('.')[2])
+            )
+        except ValueError:
+            return None
+        if payload['exp'] <= time.time():
+            return None
+        if await self.is_revoked(payload['jti']):
+            return None
+        return payload
+
+    async def revoke(self, payload: dict):
+        self._revoked.add(payload['jti'])
+        try:
+            with redis_latency.labels('token_revoke').time():
+                async with self.connection.pipeline(
+                        transaction=False) as pipeline:
+                    await pipeline \
+                        .zadd(self.KEY, {payload['jti']: payload['exp']}) \
+                        .zremrangebyscore(self.KEY, '-inf', time.time()) \
+                        .execute()
+        except RedisError as e:
+            logger.warning(f'Token revocation list is unavailable: {e}')
+
+    async def is_revoked(self, jti: str) -> bool:
+        if time.monotonic() - self._loaded_at >= self.refresh:
+            self._loaded_at = time.monotonic()
+            try:
+                with redis_latency.labels('revocation_list').time():
+                    self._revoked = set(await self.connection.zrangebyscore(
+                        self.KEY, time.time(), '+inf'
+                    ))
+            except RedisError as e:
+                logger.warning(f'Token revocation list is unavailable: {e}')
+        return jti in self._revoked
+
+    def _sign(self, signing_input: str) -> str:
+        return self._b64encode(hmac.new(self.secret, signing_input.encode(),
+                                        hashlib.sha256).digest())
+
+    @staticmethod
+    def _b64encode(data: bytes) -> str:
+        return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+    @staticmethod
+    def _b64decode(data: str) -> bytes:
+        return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
 class TokenAuth:
+    """Токены в Redis. Клиент асинхронный, соединения берутся из общего
+    с кэшами пула, проверка токена - один HGETALL. Недоступность Redis
+    при проверке токена возвращается как 503.
+
+    При cache_size > 0 данные токенов кэшируются в TokenCache. При
+    заданном secret выдаются подписанные токены SignedTokens, токены в
+    Redis при этом продолжают приниматься"""
     EXPIRE_TIME = 3 * 24 * 60 * 60
-    def __init__(self, *args, **kwargs):
-        self.connection = Redis(*args, **kwargs)
+    def __init__(self, connection: Redis, cache_size: int = 0,
+                 cache_ttl: float = 0, secret: str | None = None,
+                 revocation_refresh: float = 0):
+        self.connection = connection
+        self.cache = TokenCache(cache_size, cache_ttl) if cache_size else None
+        self.signed = None
+        if secret:
+            self.signed = SignedTokens(self.connection, secret,
+                                       revocation_refresh)
+
+    async def create_admin(self):
         if environ.get('ADMIN_TOKEN') and environ.get('ADMIN_PASSWORD'):
             logger.debug("Create admin account")
-            self.connection.hset(environ.get('ADMIN_TOKEN'),
+            await self.connection.hset(environ.get('ADMIN_TOKEN'),
                     mapping={"name": "admin", "password": environ.get('ADMIN_PASSWORD'),
                              "access_level": AccessLevel.admin.value})
 
-    def create_token(self, name: str, password: str, 
-                    access_level: int = AccessLevel.unauthorized.value):
+    async def create_token(self, name: str, password: str,
+                    access_level: int = AccessLevel.unauthorized.value,
+                    class_id: int | None = None,
+                    teacher_id: int | None = None):
         if isinstance(access_level, str) and access_level.isdigit():
             access_level = int(access_level)
         if access_level not in range(min(AccessLevel), max(AccessLevel) + 1):
             raise ValueError("invalid access_level")
+        if self.signed is not None:
+            return self.signed.encode(
+                {"name": name, "access_level": access_level,
+                 "class_id": class_id, "teacher_id": teacher_id},
+                self.EXPIRE_TIME
+            )
         token_key = str(uuid4())
-        with self.connection.pipeline() as pipeline:
-            pipeline = pipeline.hset(token_key, 
-                    mapping={"name": name, "password": password, "access_level": access_level})
-            pipeline = pipeline.expire(token_key, self.EXPIRE_TIME)
-            res = pipeline.execute()
+        with redis_latency.labels('token_create').time():
+            async with self.connection.pipeline() as pipeline:
+                pipeline = pipeline.hset(token_key,
+                        mapping={"name": name, "password": password, "access_level": access_level})
+                pipeline = pipeline.expire(token_key, self.EXPIRE_TIME)
+                await pipeline.execute()
         return token_key
 
-    def refresh_token(self, token_key: str) -> str:
-        return self.create_token(**self.connection.hgetall(token_key))
-
-    def token_exists(self, token_key: str) -> bool:
-        return self.connection.exists(token_key)
+    async def refresh_token(self, token_key: str) -> str:
+        if self.signed is not None and self.signed.is_signed(token_key):
+            payload = await self.signed.decode(token_key)
+            if payload is None:
+                raise HTTPException(status_code=401)
+            await self.signed.revoke(payload)
+            return self.signed.encode(
+                dict((k, payload[k]) for k in
+                     ('name', 'access_level', 'class_id', 'teacher_id')),
+                self.EXPIRE_TIME
+            )
+        if self.cache is not None:
+            self.cache.invalidate(token_key)
+        info = await self.connection.hgetall(token_key)
+        if not info:
+            raise HTTPException(status_code=401)
+        return await self.create_token(**info)
 
-    def get_info_by_token(self, token_key: str) -> dict:
-        return self.connection.hgetall(token_key)
+    async def get_info_by_token(self, token_key: str) -> dict:
+        if self.signed is not None and self.signed.is_signed(token_key):
+            payload = await self.signed.decode(token_key)
+            if payload is None:
+                return {}
+            return dict((k, payload[k]) for k in
+                        ('name', 'access_level', 'class_id', 'teacher_id'))
+        if self.cache is None:
+            with redis_latency.labels('token_get').time():
+                return await self.connection.hgetall(token_key)
+        info = self.cache.get(token_key)
+        if info is not None:
+            return info
+        with redis_latency.labels('token_get').time():
+            async with self.connection.pipeline(
+                    transaction=False) as pipeline:
+                info, expire = await pipeline.hgetall(token_key) \
+                    .pttl(token_key).execute()
+        if info:
+            self.cache.set(token_key, info,
+                           expire / 1000 if expire >= 0 else None)
+        else:
+            self.cache.invalidate(token_key)
+        return info
 
     def __call__(self, access_level=AccessLevel.unauthorized):
-        connection = self.connection
-
-        def _auth(auth_token: str = Header(default='')) -> dict:
-            if not self.token_exists(auth_token):
-                raise HTTPException(status_code=401)
-            user_access_level = connection.hget(auth_token, 'access_level')
-            if int(user_access_level) < access_level.value:
+        async def _auth(auth_token: str = Header(default='')) -> dict:
+            try:
+                info = await self.get_info_by_token(auth_token)
+            except RedisError as e:
+                logger.warning(f'Token storage is unavailable: {e}')
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After':
+                             str(settings.admission_retry_after)}
+                )
+            if not info or int(info['access_level']) < access_level.value:
                 raise HTTPException(status_code=401)
             return dict(
-                    [((k, v) if not v.isdigit() else (k, int(v)))
-                        for k, v in connection.hgetall(auth_token).items()
+                    [((k, int(v)) if isinstance(v, str) and v.isdigit()
+                        else (k, v))
+                        for k, v in info.items()
                     ]
             )
 
@@ -106,4 +298,8 @@ class TokenAuth:
         return self(AccessLevel.class_president)
 
 
-authenticate = TokenAuth(host='redis', charset="utf-8", decode_responses=True)
+authenticate = TokenAuth(redis_connection,
+                         cache_size=settings.auth_cache_size,
+                         cache_ttl=settings.auth_cache_ttl,
+                         secret=settings.auth_secret,
+                         revocation_refresh=settings.auth_revocation_refresh)
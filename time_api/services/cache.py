@@ -0,0 +1,542 @@
+import asyncio
+import hashlib
+import logging
+import time
+import datetime as dt
+from typing import Any, Awaitable, Callable, Optional
+from urllib.parse import urlencode
+from uuid import uuid4
+
+from fastapi import HTTPException, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.exceptions import RedisError
+from sqlalchemy import select, distinct
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from time_api import schemas
+from time_api.db import tables
+from time_api.db.base import async_session, is_replica
+from time_api.db.create import settings
+from time_api.services.metrics import cache_requests
+
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduleVersion:
+    """Счётчики версий расписания в Redis, общие для всех процессов.
+
+    schedule:version:{school_id} растёт при изменении расписания школы,
+    schedule:version:epoch - при изменениях, затрагивающих все школы,
+    schedule:version - при любом изменении"""
+    KEY = 'schedule:version'
+
+    def __init__(self, connection: Redis):
+        self.connection = connection
+
+    def _school_key(self, school_id: int) -> str:
+        return f'{self.KEY}:{school_id}'
+
+    async def bump(self, school_id: int | None = None):
+        timetable_cache.invalidate(school_id)
+        try:
+            async with self.connection.pipeline(transaction=False) as pipe:
+                if school_id is None:
+                    pipe.incr(f'{self.KEY}:epoch')
+                else:
+                    pipe.incr(self._school_key(school_id))
+                pipe.incr(self.KEY)
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning(f'Schedule version was not bumped: {e}')
+
+    async def get(self, school_id: int | None = None) -> str | None:
+        """Версия расписания школы, а без school_id - общая версия.
+        None, если Redis недоступен"""
+        try:
+            if school_id is None:
+                return f'g{await self.connection.get(self.KEY) or 0}'
+            epoch, version = await self.connection.mget(
+                f'{self.KEY}:epoch', self._school_key(school_id)
+            )
+        except RedisError as e:
+            logger.warning(f'Schedule version is unavailable: {e}')
+            return None
+        return f'{epoch or 0}.{version or 0}'
+
+
+class TimetableSnapshot:
+    """Расписание одной школы в памяти процесса: уроки с учителями,
+    подгруппы уроков и семестры"""
+
+    def __init__(
+            self,
+            school: tables.School,
+            lessons: list[tables.Lesson],
+            subgroups: list[tuple[int, int]],
+            lesson_subgroups: list[tuple[int, int]],
+            semesters: list[tables.Semester],
+            version: str | None = None
+    ):
+        self.school_id: int = school.school_id
+        self.version = version
+        self.is_using_double_week = bool(school.is_using_double_week)
+        self.teachers: dict[int, schemas.teachers.Teacher] = {}
+        self.lessons: dict[int, dict[str, Any]] = {}
+        for lesson in sorted(lessons,
+                             key=lambda i: (i.start_time, i.lesson_id)):
+            teacher = self.teachers.setdefault(
+                lesson.teacher_id,
+                schemas.teachers.Teacher.from_orm(lesson.teacher)
+            )
+            dct = schemas.lessons.InternalLesson.from_orm(lesson).dict()
+            dct['teacher'] = teacher
+            self.lessons[lesson.lesson_id] = dct
+        self.subgroups: dict[int, int] = dict(subgroups)
+        self.lesson_subgroups: dict[int, list[int]] = {}
+        for lesson_id, subgroup_id in lesson_subgroups:
+            self.lesson_subgroups.setdefault(lesson_id, []).append(subgroup_id)
+        self.semesters = [
+            schemas.semesters.Semester.from_orm(semester)
+            for semester in semesters
+        ]
+        self.loaded_at = time.monotonic()
+
+    def get_current_semester(
+            self,
+            today: dt.date | None = None
+    ) -> Optional[schemas.semesters.Semester]:
+        today = today or dt.date.today()
+        for semester in self.semesters:
+            if dt.date(**semester.start_date.dict()) <= today \
+                    <= dt.date(**semester.end_date.dict()):
+                return semester
+        return None
+
+    def get_lessons(
+            self,
+            class_id: Optional[int] = None,
+            subgroup_id: Optional[int] = None,
+            week: Optional[bool] = None,
+            weekday: Optional[int] = None,
+            teacher_id: int | None = None
+    ) -> list[dict[str, Any]]:
+        """Аналог выборки из БД: урок возвращается столько раз, сколько
+        у него подходящих подгрупп. Возвращаются копии словарей"""
+        lessons = []
+        for lesson_id, lesson in self.lessons.items():
+            if week is not None and lesson['week'] != week:
+                continue
+            if isinstance(weekday, int) and lesson['weekday'] != weekday:
+                continue
+            if teacher_id is not None \
+                    and lesson['teacher'].teacher_id != teacher_id:
+                continue
+            repeat = 1
+            if subgroup_id is not None or class_id is not None:
+                repeat = sum(
+                    1 for lesson_subgroup_id
+                    in self.lesson_subgroups.get(lesson_id, [])
+                    if (subgroup_id is None
+                        or lesson_subgroup_id == subgroup_id)
+                    and (class_id is None
+                         or self.subgroups.get(lesson_subgroup_id) == class_id)
+                )
+            lessons.extend(dict(lesson) for _ in range(repeat))
+        return lessons
+
+
+class TimetableCache:
+    """Снимки расписания по школам.
+
+    Любая запись, меняющая расписание школы, должна вызывать
+    invalidate(school_id) (это делает ScheduleVersion.bump). Без school_id
+    сбрасываются все снимки. Снимок перезагружается, если версия
+    расписания школы в Redis изменилась в другом процессе, школы учителей
+    и список всех школ - при изменении общей версии. Если Redis
+    недоступен, время жизни снимков и списков школ ограничено ttl."""
+
+    def __init__(self, ttl: int, versions: ScheduleVersion):
+        self.ttl = ttl
+        self.versions = versions
+        self._snapshots: dict[int, TimetableSnapshot] = {}
+        self._generations: dict[int, int] = {}
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._class_schools: dict[int, int] = {}
+        self._subgroup_schools: dict[int, int] = {}
+        self._teacher_schools: dict[int, list[int]] = {}
+        self._all_schools: list[int] | None = None
+        self._school_lists_version: str | None = None
+        self._school_lists_loaded_at = time.monotonic()
+
+    def invalidate(self, school_id: int | None = None):
+        if school_id is None:
+            self._snapshots.clear()
+            for key in self._generations:
+                self._generations[key] += 1
+        else:
+            self._snapshots.pop(school_id, None)
+            self._generations[school_id] = \
+                self._generations.get(school_id, 0) + 1
+        self._teacher_schools.clear()
+        self._all_schools = None
+        logger.debug(f'Timetable cache invalidated for {school_id=}')
+
+    async def get(
+            self,
+            session: AsyncSession,
+            school_id: int
+    ) -> TimetableSnapshot | None:
+        version = await self.versions.get(school_id)
+        snapshot = self._snapshots.get(school_id)
+        if self._is_fresh(snapshot, version):
+            cache_requests.labels('timetable', 'hit').inc()
+            return snapshot
+        cache_requests.labels('timetable', 'miss').inc()
+        lock = self._locks.setdefault(school_id, asyncio.Lock())
+        async with lock:
+            snapshot = self._snapshots.get(school_id)
+            if self._is_fresh(snapshot, version):
+                return snapshot
+            generation = self._generations.get(school_id, 0)
+            if is_replica(session):
+                # Снимок живёт до следующего изменения, поэтому читается
+                # с основной базы, чтобы не закэшировать отставание реплики
+                async with async_session() as primary_session:
+                    snapshot = await self._load(primary_session, school_id)
+            else:
+                snapshot = await self._load(session, school_id)
+            if snapshot is not None:
+                snapshot.version = version
+            if snapshot is not None \
+                    and generation == self._generations.get(school_id, 0):
+                self._snapshots[school_id] = snapshot
+            return snapshot
+
+    def _is_fresh(
+            self,
+            snapshot: TimetableSnapshot | None,
+            version: str | None
+    ) -> bool:
+        if snapshot is None:
+            return False
+        if time.monotonic() - snapshot.loaded_at >= self.ttl:
+            return False
+        return version is None or snapshot.version == version
+
+    async def _load(
+            self,
+            session: AsyncSession,
+            school_id: int
+    ) -> TimetableSnapshot | None:
+        school = await session.scalar(
+            select(tables.School).filter_by(school_id=school_id)
+        )
+        if school is None:
+            return None
+        lessons = list(await session.scalars(
+            select(tables.Lesson).filter_by(school_id=school_id)
+        ))
+        subgroups = list(await session.execute(
+            select(tables.Subgroup.subgroup_id, tables.Subgroup.class_id)
+            .join(tables.Class)
+            .filter(tables.Class.school_id == school_id)
+        ))
+        lesson_subgroups = list(await session.execute(
+            select(tables.LessonSubgroup.lesson_id,
+                   tables.LessonSubgroup.subgroup_id)
+            .join(tables.Lesson)
+            .filter(tables.Lesson.school_id == school_id)
+        ))
+        semesters = list(await session.scalars(
+            select(tables.Semester).filter_by(school_id=school_id)
+        ))
+        for subgroup_id, class_id in subgroups:
+            self._subgroup_schools[subgroup_id] = school_id
+            self._class_schools[class_id] = school_id
+        logger.info(f'Timetable snapshot loaded for {school_id=}: '
+                    f'{len(lessons)} lessons')
+        return TimetableSnapshot(
+            school=school,
+            lessons=lessons,
+            subgroups=subgroups,
+            lesson_subgroups=lesson_subgroups,
+            semesters=semesters
+        )
+
+    async def get_school_ids(
+            self,
+            session: AsyncSession,
+            class_id: Optional[int] = None,
+            subgroup_id: Optional[int] = None,
+            teacher_id: int | None = None
+    ) -> list[int]:
+        """Школы, в которых нужно искать уроки по заданным фильтрам"""
+        if subgroup_id is not None:
+            if subgroup_id not in self._subgroup_schools:
+                school_id = await session.scalar(
+                    select(tables.Class.school_id)
+                    .join(tables.Subgroup)
+                    .filter(tables.Subgroup.subgroup_id == subgroup_id)
+                )
+                if school_id is None:
+                    return []
+                self._subgroup_schools[subgroup_id] = school_id
+            return [self._subgroup_schools[subgroup_id]]
+
+        if class_id is not None:
+            if class_id not in self._class_schools:
+                school_id = await session.scalar(
+                    select(tables.Class.school_id).filter_by(class_id=class_id)
+                )
+                if school_id is None:
+                    return []
+                self._class_schools[class_id] = school_id
+            return [self._class_schools[class_id]]
+
+        await self._check_school_lists()
+        if teacher_id is not None:
+            if teacher_id not in self._teacher_schools:
+                self._teacher_schools[teacher_id] = list(await session.scalars(
+                    select(distinct(tables.Lesson.school_id))
+                    .filter_by(teacher_id=teacher_id)
+                ))
+            return self._teacher_schools[teacher_id]
+
+        if self._all_schools is None:
+            self._all_schools = list(await session.scalars(
+                select(tables.School.school_id)
+            ))
+        return self._all_schools
+
+    async def _check_school_lists(self):
+        """Школы учителя и список всех школ меняются записями в любой
+        школе, поэтому сбрасываются при смене общей версии расписания"""
+        version = await self.versions.get()
+        if version == self._school_lists_version and \
+                time.monotonic() - self._school_lists_loaded_at < self.ttl:
+            return
+        self._teacher_schools.clear()
+        self._all_schools = None
+        self._school_lists_version = version
+        self._school_lists_loaded_at = time.monotonic()
+
+    def find_school_id(
+            self,
+            school_id: int | None = None,
+            class_id: int | None = None,
+            subgroup_id: int | None = None
+    ) -> int | None:
+        """Школа по уже известным процессу id, без обращения к БД"""
+        if school_id is not None:
+            return school_id
+        if subgroup_id is not None:
+            return self._subgroup_schools.get(subgroup_id)
+        if class_id is not None:
+            return self._class_schools.get(class_id)
+        return None
+
+    async def get_snapshots(
+            self,
+            session: AsyncSession,
+            class_id: Optional[int] = None,
+            subgroup_id: Optional[int] = None,
+            teacher_id: int | None = None
+    ) -> list[TimetableSnapshot]:
+        school_ids = await self.get_school_ids(
+            session,
+            class_id=class_id,
+            subgroup_id=subgroup_id,
+            teacher_id=teacher_id
+        )
+        snapshots = [await self.get(session, school_id)
+                     for school_id in school_ids]
+        return [snapshot for snapshot in snapshots if snapshot is not None]
+
+
+class ResponseCache:
+    """Кэш сериализованных ответов в Redis.
+
+    Ключ строится из имени запроса, версии расписания и параметров, поэтому
+    после записи старые ответы просто перестают читаться. Ответ вычисляет
+    только тот, кто взял блокировку, остальные ждут его результат: внутри
+    процесса - на общей задаче, между процессами - опрашивая Redis."""
+
+    def __init__(
+            self,
+            connection: Redis,
+            versions: ScheduleVersion,
+            ttl: int,
+            lock_timeout: float
+    ):
+        self.connection = connection
+        self.versions = versions
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    async def get_key(
+            self,
+            name: str,
+            params: dict[str, Any],
+            school_ids: list[int]
+    ) -> str | None:
+        school_id = school_ids[0] if len(school_ids) == 1 else None
+        version = await self.versions.get(school_id)
+        if version is None:
+            return None
+        query = urlencode(sorted(
+            (key, value) for key, value in params.items() if value is not None
+        ))
+        return f'response:{name}:{dt.date.today()}:{version}:{query}'
+
+    async def get_or_compute(
+            self,
+            name: str,
+            params: dict[str, Any],
+            school_ids: list[int],
+            compute: Callable[[], Awaitable[Any]],
+            etag: str | None = None
+    ) -> Response | Any:
+        key = await self.get_key(name, params, school_ids)
+        if key is None:
+            return await compute()
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._get_or_compute(key, compute))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        body = await asyncio.shield(task)
+        headers = {'ETag': etag} if etag is not None else None
+        return Response(content=body, media_type='application/json',
+                        headers=headers)
+
+    async def _get_or_compute(
+            self,
+            key: str,
+            compute: Callable[[], Awaitable[Any]]
+    ) -> bytes:
+        try:
+            body = await self.connection.get(key)
+            if body is not None:
+                cache_requests.labels('response', 'hit').inc()
+                return body.encode()
+            cache_requests.labels('response', 'miss').inc()
+            lock_key = f'{key}:lock'
+            token = uuid4().hex
+            if await self.connection.set(lock_key, token, nx=True,
+                                         px=int(self.lock_timeout * 1000)):
+                try:
+                    body = await self._compute(compute)
+                    await self.connection.set(key, body, ex=self.ttl)
+                    return body
+                finally:
+                    await self._release(lock_key, token)
+            body = await self._wait(key, lock_key)
+            if body is not None:
+                return body.encode()
+        except RedisError as e:
+            logger.warning(f'Response cache is unavailable: {e}')
+        return await self._compute(compute)
+
+    async def _compute(self, compute: Callable[[], Awaitable[Any]]) -> bytes:
+        return JSONResponse(content=jsonable_encoder(await compute())).body
+
+    async def _wait(self, key: str, lock_key: str) -> str | None:
+        """Ответ, записанный владельцем блокировки. None, если блокировка
+        снята без записи (compute завершился ошибкой) или истекла"""
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            body, lock = await self.connection.mget(key, lock_key)
+            if body is not None or lock is None:
+                return body
+        return None
+
+    async def _release(self, lock_key: str, token: str):
+        await self.connection.eval(
+            "if redis.call('get', KEYS[1]) == ARGV[1] then "
+            "return redis.call('del', KEYS[1]) end return 0",
+            1, lock_key, token
+        )
+
+
+class ScheduleETag:
+    """Зависимость для GET запросов расписания.
+
+    ETag строится из пути, параметров, даты и версии расписания школы
+    (общей версии, если школу не удалось определить без БД). На
+    совпадающий If-None-Match сразу отвечает 304. period добавляет в ETag
+    номер интервала времени для ответов, зависящих от текущего времени.
+
+    Маршруты с ETag (в том числе все маршруты с ResponseCache) читают
+    основную базу, а не реплики, см. base.requires_primary"""
+    PARAMS = ('school_id', 'class_id', 'subgroup_id')
+    requires_primary = True
+
+    def __init__(self, versions: ScheduleVersion, period: int | None = None):
+        self.versions = versions
+        self.period = period
+
+    async def __call__(
+            self,
+            request: Request,
+            response: Response
+    ) -> str | None:
+        ids = {}
+        for name in self.PARAMS:
+            value = request.path_params.get(name,
+                                            request.query_params.get(name))
+            if value is not None and str(value).isdigit():
+                ids[name] = int(value)
+        if request.query_params.get('teacher_id') is None:
+            school_id = timetable_cache.find_school_id(**ids)
+        else:
+            school_id = None
+        version = await self.versions.get(school_id)
+        if version is None:
+            return None
+
+        parts = [request.url.path, str(sorted(request.query_params.items())),
+                 version, str(dt.date.today())]
+        if self.period:
+            parts.append(str(int(time.time() // self.period)))
+        digest = hashlib.sha1('|'.join(parts).encode()).hexdigest()[:20]
+        etag = f'W/"{digest}"'
+
+        if_none_match = request.headers.get('if-none-match', '')
+        tags = [tag.strip().removeprefix('W/')
+                for tag in if_none_match.split(',')]
+        if '*' in tags or etag.removeprefix('W/') in tags:
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED,
+                                headers={'ETag': etag})
+        response.headers['ETag'] = etag
+        return etag
+
+
+# Общий пул процесса для кэшей, токенов и задач загрузки. При занятых
+# соединениях команды ждут свободное до redis_pool_timeout секунд
+redis_connection = Redis(connection_pool=BlockingConnectionPool(
+    host=settings.redis_host,
+    decode_responses=True,
+    max_connections=settings.redis_max_connections,
+    timeout=settings.redis_pool_timeout
+))
+schedule_version = ScheduleVersion(redis_connection)
+timetable_cache = TimetableCache(
+    ttl=settings.timetable_cache_ttl,
+    versions=schedule_version
+)
+response_cache = ResponseCache(
+    redis_connection,
+    versions=schedule_version,
+    ttl=settings.response_cache_ttl,
+    lock_timeout=settings.response_cache_lock_timeout
+)
+schedule_etag = ScheduleETag(schedule_version)
+timed_schedule_etag = ScheduleETag(
+    schedule_version,
+    period=settings.response_cache_ttl
+)
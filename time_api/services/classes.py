@@ -7,6 +7,7 @@ from fastapi import status, HTTPException
 from .base import BaseService
 from time_api import schemas
 from time_api.db import tables
+from time_api.services.cache import schedule_version
 
 
 logger = logging.getLogger(__name__)
@@ -77,6 +78,7 @@ class ClassService(BaseService):
 
             self.session.add(new_class)
             await self.session.commit()
+            await schedule_version.bump(new_class.school_id)
 
         except exc.IntegrityError:
             await self.session.rollback()
@@ -95,3 +97,4 @@ class ClassService(BaseService):
         _class = await self.get(class_id=class_id)
         await self.session.delete(_class)
         await self.session.commit()
+        await schedule_version.bump(_class.school_id)
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from uuid import uuid4
+
+from fastapi import HTTPException, Response, status
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from time_api import schemas
+from time_api.db.base import async_session
+from time_api.db.create import settings
+from time_api.services.cache import redis_connection
+from time_api.services.parser import TimetableService, parse_timetable_async
+
+
+logger = logging.getLogger(__name__)
+
+
+class ImportJobs:
+    """Очередь фоновых загрузок расписания.
+
+    Загрузки выполняются в процессе, принявшем файл, не более workers
+    одновременно. Файлы ожидающих задач хранятся в памяти, поэтому задач
+    в очереди и выполняемых не больше max_jobs, следующие отклоняются с
+    503. Состояние задач хранится в Redis, чтобы его мог вернуть любой
+    процесс, и до завершения задачи дублируется в памяти на случай
+    недоступности Redis"""
+    KEY = 'timetable:job'
+
+    def __init__(
+            self,
+            connection: Redis,
+            workers: int,
+            max_jobs: int,
+            ttl: int,
+            retry_after: int
+    ):
+        self.connection = connection
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(workers)
+        self._jobs: dict[str, schemas.timetable.ImportJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def active(self) -> int:
+        """Задачи процесса в очереди и выполняемые"""
+        return len(self._tasks)
+
+    async def submit(
+            self,
+            lessons_file: bytes,
+            school_id: int
+    ) -> schemas.timetable.ImportJob:
+        if self.active >= self.max_jobs:
+            logger.warning(f'Import job for {school_id=} is rejected, '
+                           f'{self.active} jobs are active')
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail='Too many import jobs',
+                headers={'Retry-After': str(self.retry_after)}
+            )
+        job = schemas.timetable.ImportJob(job_id=str(uuid4()),
+                                          school_id=school_id)
+        await self._save(job)
+        task = asyncio.create_task(self._run(job, lessons_file))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def get(self, job_id: str) -> schemas.timetable.ImportJob:
+        if job_id in self._jobs:
+            return self._jobs[job_id]
+        try:
+            data = await self.connection.get(f'{self.KEY}:{job_id}')
+        except RedisError as e:
+            logger.warning(f'Import job storage is unavailable: {e}')
+            data = None
+        if data is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+        return schemas.timetable.ImportJob.parse_raw(data)
+
+    async def _save(self, job: schemas.timetable.ImportJob):
+        self._jobs[job.job_id] = job
+        try:
+            await self.connection.set(f'{self.KEY}:{job.job_id}', job.json(),
+                                      ex=self.ttl)
+        except RedisError as e:
+            logger.warning(f'Import job storage is unavailable: {e}')
+
+    async def _run(
+            self,
+            job: schemas.timetable.ImportJob,
+            lessons_file: bytes
+    ):
+        async with self._semaphore:
+            started = time.monotonic()
+            try:
+                job.status = 'parsing'
+                await self._save(job)
+                data = await parse_timetable_async(lessons_file)
+
+                job.status = 'importing'
+                job.parsed_rows = len(data['lessons'])
+                await self._save(job)
+                async with async_session() as session:
+                    service = TimetableService(session, Response())
+                    await service.create_classes(data, job.school_id)
+                    diff = await service.create(data['lessons'],
+                                                job.school_id)
+
+                job.status = 'done'
+                job.added_lessons = len(diff.added)
+                job.removed_lessons = len(diff.removed)
+                job.changed_lessons = len(diff.changed)
+            except HTTPException as e:
+                job.status = 'failed'
+                job.errors.append(f'{e.status_code}: {e.detail}')
+            except Exception:
+                logger.exception(f'Import job {job.job_id} failed')
+                job.status = 'failed'
+                job.errors.append('Internal error')
+            job.duration = round(time.monotonic() - started, 3)
+            try:
+                await self._save(job)
+            finally:
+                self._jobs.pop(job.job_id, None)
+            logger.info(f'Import job {job.job_id} is {job.status} '
+                        f'in {job.duration}s')
+
+
+import_jobs = ImportJobs(
+    redis_connection,
+    workers=settings.import_workers,
+    max_jobs=settings.import_max_jobs,
+    ttl=settings.import_job_ttl,
+    retry_after=settings.admission_retry_after
+)
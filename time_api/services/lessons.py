@@ -10,8 +10,9 @@ from time_api.services.base import BaseService
 from time_api.db import tables
 from time_api.schemas.lessons import LessonCreate, Lesson
 from time_api import schemas
-from time_api.services.teachers import TeacherService
-from time_api.services.semesters import SemesterService
+from time_api.services.cache import (
+    timetable_cache, schedule_version, TimetableSnapshot
+)
 from time_api.services.lessons_hotfix import LessonHotfixService
 
 logger = logging.getLogger(__name__)
@@ -19,6 +20,19 @@ logger = logging.getLogger(__name__)
 
 class LessonService(BaseService):
 
+    async def get_school_ids(
+            self,
+            class_id: Optional[int] = None,
+            subgroup_id: Optional[int] = None,
+            teacher_id: int | None = None
+    ) -> list[int]:
+        return await timetable_cache.get_school_ids(
+            self.session,
+            class_id=class_id,
+            subgroup_id=subgroup_id,
+            teacher_id=teacher_id
+        )
+
     async def get_list(
             self,
             class_id: Optional[int] = None,
@@ -29,23 +43,25 @@ class LessonService(BaseService):
             group_by_weekdays: Optional[bool] = None,
             teacher_id: int | None = None
     ) -> schemas.lessons.LessonList | schemas.lessons.LessonListWithDouble:
-        semester_service = SemesterService(self.session, self.response)
-        try:
-            await semester_service.get_current()
-        except HTTPException as e:
-            if e.status_code == 404:
-                return schemas.lessons.LessonList(lessons=[])
-            else:
-                raise e
+        snapshots = await timetable_cache.get_snapshots(
+            self.session,
+            class_id=class_id,
+            subgroup_id=subgroup_id,
+            teacher_id=teacher_id
+        )
+        current_snapshots = [snapshot for snapshot in snapshots
+                             if snapshot.get_current_semester() is not None]
+        if snapshots and not current_snapshots:
+            return schemas.lessons.LessonList(lessons=[])
 
         lessons = await self._get_list(
             class_id=class_id,
             subgroup_id=subgroup_id,
             week=week,
             weekday=weekday,
-            teacher_id=teacher_id
+            teacher_id=teacher_id,
+            snapshots=current_snapshots
         )
-        lessons = [await self._add_teacher(lesson) for lesson in lessons]
 
         if group_by_weekdays:
             lessons.sort(key=lambda i: i['weekday'])
@@ -76,98 +92,79 @@ class LessonService(BaseService):
             self,
             lessons: list
     ) -> list[schemas.lessons.DoubleLesson]:
-        if any([isinstance(lesson, schemas.lessons.Lesson) for lesson in lessons]):
-            lessons = [dict(lesson) for lesson in lessons]
-        checked_indexes = []
-        for i in range(len(lessons)):
-            if i in checked_indexes:
+        """Объединяет идущие подряд уроки дня с одинаковыми названием,
+        учителем и кабинетом в один DoubleLesson любой длины.
+
+        Один проход: для каждого дня хранится последний объединённый урок,
+        поэтому список может содержать уроки всей недели в порядке времени.
+        Повторы урока (по одному на подгруппу класса) не добавляют время"""
+        doubled = []
+        last_lessons: dict[tuple, tuple[tuple, dict[str, Any]]] = {}
+        for lesson in lessons:
+            lesson = dict(lesson)
+            day = (lesson['weekday'], lesson.get('week'))
+            key = (
+                lesson['name'],
+                getattr(lesson.get('teacher'), 'teacher_id',
+                        lesson.get('teacher_id')),
+                lesson['room']
+            )
+            last_key, last = last_lessons.get(day, (None, None))
+            if key == last_key:
+                if last['lesson_id'][-1] != lesson['lesson_id']:
+                    last['start_time'].append(lesson['start_time'])
+                    last['end_time'].append(lesson['end_time'])
+                    last['lesson_id'].append(lesson['lesson_id'])
                 continue
-            if i < len(lessons) - 1 \
-                    and lessons[i]['name'] == lessons[i + 1]['name'] \
-                    and lessons[i].get('teacher_id') == lessons[i + 1].get('teacher_id') \
-                    and lessons[i]['room'] == lessons[i + 1]['room']:
-                lessons[i]['start_time'] = [
-                    lessons[i]['start_time'],
-                    lessons[i + 1]['start_time']
-                ]
-                lessons[i]['end_time'] = [
-                    lessons[i]['end_time'],
-                    lessons[i + 1]['end_time']
-                ]
-                lessons[i]['lesson_id'] = [
-                        lessons[i]['lesson_id'], 
-                        lessons[i + 1]['lesson_id']
-                ]
-                checked_indexes.append(i + 1)
-            else:
-                lessons[i]['start_time'] = [lessons[i]['start_time']]
-                lessons[i]['end_time'] = [lessons[i]['end_time']]
-                lessons[i]['lesson_id'] = [lessons[i]['lesson_id']]
-        for i in sorted(checked_indexes, reverse=True):
-            del lessons[i]
-        return lessons 
-
-    async def _add_teacher(
+            lesson['start_time'] = [lesson['start_time']]
+            lesson['end_time'] = [lesson['end_time']]
+            lesson['lesson_id'] = [lesson['lesson_id']]
+            last_lessons[day] = (key, lesson)
+            doubled.append(lesson)
+        return doubled
+
+    def _add_teacher(
             self,
             lesson: tables.Lesson
     ) -> dict[str, Any]:
         dct = schemas.lessons.InternalLesson.from_orm(lesson).dict()
-        dct['teacher'] = await self._get_teacher(lesson.teacher_id)
+        dct['teacher'] = lesson.teacher
         return dct
 
-    async def _get_teacher(
-            self,
-            teacher_id: int
-    ):
-        teacher_service = TeacherService(self.session, self.response)
-        return await teacher_service.get(teacher_id=teacher_id)
-
     async def _get_list(
             self,
             class_id: Optional[int] = None,
             subgroup_id: Optional[int] = None,
             week: Optional[bool] = None,
             weekday: Optional[int | list[int]] = None,
-            teacher_id: int | None = None
-    ) -> list[tables.Lesson] | list[list[tables.Lesson]]:
-
-        query = select(tables.Lesson)
-
-        if subgroup_id is not None or class_id is not None:
-            query = query.join(tables.LessonSubgroup)
-
-        if subgroup_id is not None:
-            query = query.filter_by(
-                subgroup_id=subgroup_id
-            )
-
-        if class_id is not None:
-            query = query.join(tables.Subgroup)
-            query = query.filter_by(
-                class_id=class_id
+            teacher_id: int | None = None,
+            snapshots: list[TimetableSnapshot] | None = None
+    ) -> list[dict[str, Any]]:
+        if snapshots is None:
+            snapshots = await timetable_cache.get_snapshots(
+                self.session,
+                class_id=class_id,
+                subgroup_id=subgroup_id,
+                teacher_id=teacher_id
             )
 
-        if week is not None:
-            query = query.filter(
-                tables.Lesson.week == week
+        lessons = [
+            lesson for snapshot in snapshots
+            for lesson in snapshot.get_lessons(
+                class_id=class_id,
+                subgroup_id=subgroup_id,
+                week=week,
+                weekday=weekday,
+                teacher_id=teacher_id
             )
-
-        if weekday is not None:
-            if isinstance(weekday, int):
-                query = query.filter(
-                    tables.Lesson.weekday == weekday
-                )
-
-        if teacher_id is not None:
-            query = query.filter_by(teacher_id=teacher_id)
-
-        query = query.order_by(tables.Lesson.start_time)
-
-        lessons = list(await self.session.scalars(query))
+        ]
 
         if not lessons:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
+        if len(snapshots) > 1:
+            lessons.sort(key=lambda i: (i['start_time']['hour'],
+                                        i['start_time']['minute']))
         return lessons
 
     async def get_weekday_list(
@@ -179,8 +176,13 @@ class LessonService(BaseService):
         lessons = await self._get_list(class_id=class_id,
                                        subgroup_id=subgroup_id,
                                        weekday=weekday)
-        lessons = [await self._add_teacher(lesson) for lesson in lessons]
         logger.debug(f'Today has {lessons=}')
+        return self._to_lesson_list(lessons)
+
+    def _to_lesson_list(
+            self,
+            lessons: list[dict[str, Any]]
+    ) -> schemas.lessons.LessonList:
         returned_lessons: list[Lesson] = []
         for lesson in lessons:
             schemas_lesson = Lesson(
@@ -203,42 +205,28 @@ class LessonService(BaseService):
             lessons=returned_lessons
         )
 
-    async def is_using_double_week(
-            self,
-            class_id: int | None = None,
-            subgroup_id: int | None = None
-    ) -> bool:
-        query = select(tables.School.is_using_double_week).join(tables.Class)
-        if class_id is not None:
-            query.filter_by(class_id=class_id)
-
-        if subgroup_id is not None:
-            query = query.join(tables.Subgroup)
-            query = query.filter_by(subgroup_id=subgroup_id)
-
-        return await self.session.scalar(query)
-
     async def get_today_list(
             self,
             class_id: Optional[int] = None,
             subgroup_id: Optional[int] = None
     ) -> schemas.lessons.LessonList:
-        logger.info(f'Current time is {dt.datetime.now()}')
-        today = dt.datetime.today().weekday()
-        is_using_double_week = await self.is_using_double_week(
-            class_id, subgroup_id
-        )
-        week_range = 7 + 7 * is_using_double_week
-        for day in range(week_range):
-            lessons = await self.get_weekday_list(
-                weekday=(today + day) % week_range,
-                class_id=class_id,
-                subgroup_id=subgroup_id
-            )
-            last_end_time = dt.time(**lessons.lessons[-1].end_time.dict())
-            is_ended = last_end_time < dt.datetime.now().time() and not day
-            if lessons and not is_ended:
-                return lessons
+        now = dt.datetime.now()
+        logger.info(f'Current time is {now}')
+        today = now.weekday()
+        lessons = await self._get_list(class_id=class_id,
+                                       subgroup_id=subgroup_id)
+        days: dict[int, list[dict[str, Any]]] = {}
+        for lesson in lessons:
+            days.setdefault(lesson['weekday'], []).append(lesson)
+
+        for day in range(7):
+            day_lessons = days.get((today + day) % 7)
+            if not day_lessons:
+                continue
+            last_end_time = dt.time(**day_lessons[-1]['end_time'])
+            if not day and last_end_time < now.time():
+                continue
+            return self._to_lesson_list(day_lessons)
         return schemas.lessons.LessonList(lessons=[])
 
     async def get_weekday_list_with_weekday(
@@ -263,41 +251,62 @@ class LessonService(BaseService):
             do_double: bool = False,
             weekday: int = None
     ) -> schemas.lessons.LessonList | schemas.lessons.LessonListWithDouble:
+        """Ближайший день с уроками, начиная с weekday текущей недели.
+
+        Неделя уроков и изменения на две недели вперёд загружаются один раз,
+        дни перебираются в памяти, пока не найдётся день с уроками"""
+        now = dt.datetime.now()
+        today = now.date()
         if weekday is None:
-            weekday = dt.datetime.today().weekday()
-        nearest_lessons = await self.get_list(
+            weekday = today.weekday()
+        first_day = (weekday - today.weekday()) % 7
+
+        week = await self.get_list(
             class_id=class_id,
             subgroup_id=subgroup_id,
             group_by_weekdays=True,
             teacher_id=teacher_id
         )
-        nearest_lessons = list(filter(lambda i: i.lessons and i.lessons[0].weekday >= weekday, 
-                                      nearest_lessons)) + \
-                          list(filter(lambda i: i.lessons and i.lessons[0].weekday < weekday,
-                                      nearest_lessons))
-        ret = None
-        for group in nearest_lessons:
-            if group.lessons:
-                if weekday == group.lessons[0].weekday:
-                    end_time = group.lessons[-1].end_time
-                    if end_time.hour < dt.datetime.now().hour \
-                            or end_time.hour == dt.datetime.now().hour \
-                            and end_time.minute < dt.datetime.now().minute:
-                        continue
-                ret = group
+        if not isinstance(week, list):
+            week = [week]
+        days = {group.lessons[0].weekday: group.lessons
+                for group in week if group.lessons}
+        if not days:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+        hotfix_service = LessonHotfixService(self.session, self.response)
+        hotfixes = await hotfix_service.get_states(
+            start_date=today + dt.timedelta(days=first_day),
+            end_date=today + dt.timedelta(days=first_day + 13),
+            lesson_ids=[lesson.lesson_id for lessons in days.values()
+                        for lesson in lessons],
+            school_ids=list({lesson.school_id for lessons in days.values()
+                             for lesson in lessons})
+        )
+
+        lessons = None
+        for day in range(first_day, first_day + 14):
+            date = today + dt.timedelta(days=day)
+            day_lessons = days.get(date.weekday())
+            if not day_lessons:
+                continue
+            if not day:
+                end_time = day_lessons[-1].end_time
+                if (end_time.hour, end_time.minute) < (now.hour, now.minute):
+                    continue
+            lessons = hotfix_service.apply_hotfixes(day_lessons,
+                                                    hotfixes.get(date, []))
+            if lessons:
                 break
 
-        if ret is None:
+        if not lessons:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-        hotfix_service = LessonHotfixService(self.session, self.response)
-        lessons_weekday = ret.lessons[0].weekday
-        ret = await hotfix_service.hotfix_lessons(ret)
-        if not ret.lessons:
-            return await self.get_nearest_list(class_id, subgroup_id, do_double, lessons_weekday + 1)
         if do_double:
-            ret = schemas.lessons.LessonListWithDouble(lessons=self._double_lessons(ret.lessons))
-        return ret
+            return schemas.lessons.LessonListWithDouble(
+                lessons=self._double_lessons(lessons)
+            )
+        return schemas.lessons.LessonList(lessons=lessons)
 
     async def get(
             self, *,
@@ -329,7 +338,10 @@ class LessonService(BaseService):
             await self.session.rollback()
             new_lesson = await self.get(lesson_schema=lesson_schema)
             self.response.status_code = status.HTTP_200_OK
-        return await self._add_teacher(new_lesson)
+        else:
+            await self.session.refresh(new_lesson, ['teacher'])
+            await schedule_version.bump(new_lesson.school_id)
+        return self._add_teacher(new_lesson)
 
     async def add_subgroup_to_lesson(
             self,
@@ -347,6 +359,11 @@ class LessonService(BaseService):
             return schemas.subgroups_lessons.LessonSubgroup(
                 **subgroup_lesson.dict()
             )
+        await schedule_version.bump(await self.session.scalar(
+            select(tables.Lesson.school_id).filter_by(
+                lesson_id=subgroup_lesson.lesson_id
+            )
+        ))
         return new_lesson_subgroup
 
 
@@ -3,13 +3,14 @@ import datetime as dt
 from typing import Optional, Any
 from itertools import groupby
 
-from sqlalchemy import select, exc
+from sqlalchemy import select, exc, or_, and_
 from fastapi import status, HTTPException
 
 from time_api.services.base import BaseService
 from time_api.db import tables
 from time_api.schemas.lessons import LessonCreate, Lesson
 from time_api import schemas
+from time_api.services.cache import schedule_version
 
 logger = logging.getLogger(__name__)
 
@@ -26,8 +27,20 @@ class LessonHotfixService(BaseService):
             await self.session.commit()
         except exc.IntegrityError as e:
             raise HTTPException(400, detail='Not found or conflict. Check data')
+        await schedule_version.bump(await self._get_school_id(hotfix))
         return hotfix
 
+    async def _get_school_id(
+            self,
+            hotfix: tables.LessonHotfix
+    ) -> int | None:
+        if hotfix.school_id is not None or hotfix.lesson_id is None:
+            return hotfix.school_id
+        query = select(tables.Lesson.school_id).filter_by(
+            lesson_id=hotfix.lesson_id
+        )
+        return await self.session.scalar(query)
+
     async def get(
             self,
             hotfix_id: int
@@ -35,52 +48,72 @@ class LessonHotfixService(BaseService):
         query = select(tables.LessonHotfix).filter_by(hotfix_id=hotfix_id)
         return await self.session.scalar(query)
 
-    async def get_state(
-            self, 
-            lesson_id: int = None, 
-            for_date: dt.date = None
-) -> list[dict[str, Any]]:
-        query = select(tables.LessonHotfix)
-        if lesson_id is not None:
-            query = query.filter_by(lesson_id=lesson_id)
-        if for_date is not None:
-            query = query.filter_by(for_date=for_date)
+    async def get_states(
+            self,
+            start_date: dt.date,
+            end_date: dt.date,
+            lesson_ids: list[int],
+            school_ids: list[int]
+    ) -> dict[dt.date, list[dict[str, Any]]]:
+        """Изменения уроков и отмены дней школ за [start_date, end_date]
+        одним запросом, сгруппированные по дате"""
+        query = select(tables.LessonHotfix).filter(
+            tables.LessonHotfix.for_date >= start_date,
+            tables.LessonHotfix.for_date <= end_date,
+            or_(
+                tables.LessonHotfix.lesson_id.in_(lesson_ids),
+                and_(tables.LessonHotfix.lesson_id.is_(None),
+                     tables.LessonHotfix.school_id.in_(school_ids))
+            )
+        )
+        states: dict[dt.date, list[dict[str, Any]]] = {}
+        for hotfix in await self.session.scalars(query):
+            states.setdefault(hotfix.for_date, []).append(
+                self._to_state(hotfix)
+            )
+        return states
 
-        hotfixes = await self.session.scalars(query)
+    def _to_state(self, hotfix: tables.LessonHotfix) -> dict[str, Any]:
         exclude = ('_sa_instance_state', 'hotfix_id', 'for_date')
-        hotfixes = [dict([(key, value) for key, value in hotfix.__dict__.items() 
-            if value is not None and key not in exclude]) for hotfix in hotfixes]
-        return hotfixes
+        return dict([(key, value) for key, value in hotfix.__dict__.items()
+                     if value is not None and key not in exclude])
 
-    async def hotfix_lessons(
+    def apply_hotfixes(
             self,
-            lessons_list: schemas.lessons.LessonList
-    ):
-        lessons_day = dt.date.today()
-        days_to_lessons_day = (lessons_list.lessons[0].weekday - dt.date.today().weekday()) % 7
-        lessons_day += dt.timedelta(days=days_to_lessons_day)
-        hotfixes = await self.get_state(for_date=lessons_day)
-        if hotfixes:
-            if any([hf.get('lesson_id') is None and not hf['is_existing'] \
-                        and hf.get('school_id') == lessons_list.lessons[0].school_id
-                    for hf in hotfixes]):
-                return schemas.lessons.LessonList(lessons=[])
-            lessons = []
-            for lesson in lessons_list.lessons:
-                existing = True
-                if lesson.lesson_id in [hf['lesson_id'] for hf in hotfixes]:
-                    lesson_hotfixes = [hf for hf in hotfixes if hf['lesson_id'] == lesson.lesson_id]
-                    lesson = lesson.dict()
-                    for hotfix in lesson_hotfixes:
-                        existing = hotfix.pop('is_existing', True)
-                        lesson = lesson | hotfix
-                    lesson = schemas.lessons.Lesson(**lesson)
-                if existing:
-                    lessons.append(lesson)
-            lessons_list.lessons = lessons
-        return lessons_list
+            lessons: list[schemas.lessons.Lesson],
+            hotfixes: list[dict[str, Any]]
+    ) -> list[schemas.lessons.Lesson]:
+        """Уроки одного дня с учётом изменений на этот день"""
+        if not hotfixes:
+            return lessons
+        cancelled_schools = {
+            hf.get('school_id') for hf in hotfixes
+            if hf.get('lesson_id') is None and not hf['is_existing']
+        }
+        lesson_hotfixes: dict[int, list[dict[str, Any]]] = {}
+        for hf in hotfixes:
+            if hf.get('lesson_id') is not None:
+                lesson_hotfixes.setdefault(hf['lesson_id'], []).append(hf)
+
+        returned_lessons = []
+        for lesson in lessons:
+            if lesson.school_id in cancelled_schools:
+                continue
+            existing = True
+            if lesson.lesson_id in lesson_hotfixes:
+                lesson = lesson.dict()
+                for hotfix in lesson_hotfixes[lesson['lesson_id']]:
+                    hotfix = dict(hotfix)
+                    existing = hotfix.pop('is_existing', True)
+                    lesson = lesson | hotfix
+                lesson = schemas.lessons.Lesson(**lesson)
+            if existing:
+                returned_lessons.append(lesson)
+        return returned_lessons
 
     async def delete(self, hotfix_id: int):
         hotfix = await self.get(hotfix_id)
+        school_id = await self._get_school_id(hotfix)
         await self.session.delete(hotfix)
         await self.session.commit()
+        await schedule_version.bump(school_id)
@@ -0,0 +1,127 @@
+import os
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client import REGISTRY, generate_latest, multiprocess
+
+from time_api.db import base
+
+
+request_latency = Histogram(
+    'http_request_duration_seconds',
+    'Request latency by route',
+    ['method', 'route']
+)
+requests_total = Counter(
+    'http_requests',
+    'Responses by route and status',
+    ['method', 'route', 'status']
+)
+pool_checked_out = Gauge(
+    'db_pool_checked_out',
+    'Connections checked out from the pool',
+    ['pool'],
+    multiprocess_mode='livesum'
+)
+pool_overflow = Gauge(
+    'db_pool_overflow',
+    'Connections opened over pool_size',
+    ['pool'],
+    multiprocess_mode='livesum'
+)
+pool_wait = Gauge(
+    'db_pool_wait_seconds',
+    'Average wait for a pool connection',
+    ['pool'],
+    multiprocess_mode='livemax'
+)
+redis_latency = Histogram(
+    'redis_command_duration_seconds',
+    'Redis call latency',
+    ['operation'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, 1)
+)
+parser_duration = Histogram(
+    'timetable_parse_duration_seconds',
+    'Timetable file parsing time',
+    buckets=(.1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+)
+parser_rows = Counter(
+    'timetable_parsed_rows',
+    'Lessons parsed from timetable files'
+)
+cache_requests = Counter(
+    'cache_requests',
+    'Cache lookups by result',
+    ['cache', 'result']
+)
+admission_rejected = Counter(
+    'admission_rejected_requests',
+    'Requests rejected by admission control',
+    ['priority']
+)
+
+
+_routes = {}
+
+
+def get_route(scope) -> str:
+    """Шаблон пути обработанного запроса, unmatched для неизвестных путей"""
+    if not _routes:
+        _routes.update(
+            (route.endpoint, route.path)
+            for route in scope['app'].routes
+            if hasattr(route, 'endpoint')
+        )
+    return _routes.get(scope.get('endpoint'), 'unmatched')
+
+
+class MetricsMiddleware:
+    """ASGI middleware, записывающий время и статус ответа по шаблону пути
+    и состояние пулов соединений после каждого запроса"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def _send(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            route = get_route(scope)
+            request_latency.labels(scope['method'], route) \
+                .observe(time.perf_counter() - started)
+            requests_total.labels(scope['method'], route, status_code).inc()
+            self.update_pools()
+
+    @staticmethod
+    def update_pools():
+        engines = [('primary', base.engine)] + [
+            (f'replica{i}', engine)
+            for i, engine in enumerate(base.replica_engines)
+        ]
+        for name, engine in engines:
+            if engine is None:
+                continue
+            pool_checked_out.labels(name).set(engine.pool.checkedout())
+            pool_overflow.labels(name).set(max(engine.pool.overflow(), 0))
+            pool_wait.labels(name).set(engine.pool.wait)
+
+
+def get_metrics() -> bytes:
+    """Метрики процесса, а при заданном PROMETHEUS_MULTIPROC_DIR - всех
+    процессов gunicorn"""
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
@@ -1,17 +1,24 @@
 import pandas as pd
+import asyncio
+import io
 import itertools
 import logging
+from concurrent.futures import ProcessPoolExecutor
 
-from sqlalchemy import select, exc
+from typing import Any
+
+from sqlalchemy import select, exc, delete, update
+from sqlalchemy.dialects.postgresql import insert
 from fastapi import HTTPException, status
 
 from .base import BaseService
 from time_api.db import tables
 from time_api import schemas
 from time_api.services.lessons import LessonService
-from time_api.services.subgroups import SubgroupService
-from time_api.services.classes import ClassService
 from time_api.services.lessons_hotfix import LessonHotfixService
+from time_api.services.cache import schedule_version
+from time_api.db.create import settings
+from time_api.services.metrics import parser_duration, parser_rows
 
 import datetime as dt
 
@@ -68,50 +75,313 @@ class TimetableService(BaseService):
             )
             await hotfix_service.create(hotfix_schema)
 
+    LESSON_KEY = ('name', 'start_time', 'end_time', 'weekday', 'room',
+                  'school_id', 'teacher_id')
+    CHUNK_SIZE = 1000
+    # create_classes добавил классы или подгруппы
+    _has_new_classes = False
+
+    async def create_classes(
+            self,
+            timetable_data: dict[str, list],
+            school_id: int
+    ):
+        """Классы и их подгруппы из разобранного файла.
+        Изменения фиксирует create"""
+        classes = [
+            dict(number=int(class_number), letter=class_letter,
+                 school_id=school_id)
+            for class_number in timetable_data['class_numbers']
+            for class_letter in timetable_data['class_letters']
+        ]
+        if not classes:
+            return
+        result = await self.session.execute(
+            insert(tables.Class).values(classes).on_conflict_do_nothing()
+        )
+        self._has_new_classes |= result.rowcount > 0
+        class_ids = await self.session.scalars(
+            select(tables.Class.class_id).filter(
+                tables.Class.school_id == school_id,
+                tables.Class.number.in_({dct['number'] for dct in classes}),
+                tables.Class.letter.in_({dct['letter'] for dct in classes})
+            )
+        )
+        subgroups = [
+            dict(class_id=class_id, name=subgroup_name)
+            for class_id in class_ids
+            for subgroup_name in timetable_data['subgroup_names']
+        ]
+        if subgroups:
+            result = await self.session.execute(
+                insert(tables.Subgroup).values(subgroups)
+                .on_conflict_do_nothing()
+            )
+            self._has_new_classes |= result.rowcount > 0
+
     async def create(
+            self,
+            lessons: list[dict],
+            school_id: int,
+            dry_run: bool = False
+    ) -> schemas.timetable.TimetableDiff:
+        """Загрузка уроков школы одной транзакцией. Записываются только
+        отличия файла от текущего расписания, при dry_run они лишь
+        возвращаются, а классы из create_classes откатываются"""
+        school = await self.session.scalar(
+            select(tables.School).filter_by(school_id=school_id)
+            .with_for_update()
+        )
+        if school is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail='school')
+        diff, replaced_ids = self._get_diff(
+            await self._get_file_lessons(lessons, school_id),
+            await self._get_current_lessons(school_id)
+        )
+        if dry_run:
+            await self.session.rollback()
+            return diff
+        await self._apply_diff(diff, school_id, replaced_ids)
+        await self.session.commit()
+        if (diff.added or diff.removed or diff.changed
+                or self._has_new_classes):
+            await schedule_version.bump(school_id)
+        return diff
+
+    async def _get_file_lessons(
             self,
             lessons: list[dict],
             school_id: int
-    ):
-        lesson_service = LessonService(session=self.session, response=self.response)
-        subgroup_service = SubgroupService(session=self.session, response=self.response)
-        class_service = ClassService(self.session, self.response)
+    ) -> dict[tuple, tuple[dict[str, Any], set[int]]]:
+        class_ids = dict(
+            ((number, letter), class_id) for class_id, number, letter
+            in await self.session.execute(
+                select(tables.Class.class_id, tables.Class.number,
+                       tables.Class.letter)
+                .filter_by(school_id=school_id)
+            )
+        )
+        subgroup_ids = dict(
+            ((class_id, name), subgroup_id) for subgroup_id, class_id, name
+            in await self.session.execute(
+                select(tables.Subgroup.subgroup_id, tables.Subgroup.class_id,
+                       tables.Subgroup.name)
+                .join(tables.Class)
+                .filter(tables.Class.school_id == school_id)
+            )
+        )
+
+        file_lessons = {}
         for lesson in lessons:
-            lesson_schema = schemas.lessons.LessonCreate(
-                name=lesson['name'],
-                start_time=schemas.times.Time(
-                    hour=lesson['start_hour'],
-                    minute=lesson['start_minute']
-                ),
-                end_time=schemas.times.Time(
-                    hour=lesson['end_hour'],
-                    minute=lesson['end_minute']
-                ),
-                week=lesson['week'],
-                weekday=lesson['weekday'],
-                room=lesson['room'] if lesson['room'] else '',
-                school_id=school_id,
-                teacher_id=lesson['teacher_id']
+            row = self._get_lesson_row(lesson, school_id)
+            key = tuple(row[column] for column in self.LESSON_KEY)
+            class_id = class_ids.get(
+                (int(lesson['class_number']), lesson['class_letter'])
+            )
+            if class_id is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                    detail='class')
+            subgroup_id = subgroup_ids.get((class_id, lesson['subgroup']))
+            if subgroup_id is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                    detail='subgroup')
+            file_lessons.setdefault(key, (row, set()))[1].add(subgroup_id)
+        return file_lessons
+
+    async def _get_current_lessons(
+            self,
+            school_id: int
+    ) -> dict[tuple, tuple[dict[str, Any], set[int]]]:
+        current_lessons = {}
+        lesson_keys = {}
+        columns = ('lesson_id', 'week', *self.LESSON_KEY)
+        for lesson in await self.session.execute(
+                select(*[getattr(tables.Lesson, column) for column in columns])
+                .filter_by(school_id=school_id)):
+            row = dict(zip(columns, lesson))
+            key = tuple(row[column] for column in self.LESSON_KEY)
+            current_lessons[key] = (row, set())
+            lesson_keys[row['lesson_id']] = key
+        for lesson_id, subgroup_id in await self.session.execute(
+                select(tables.LessonSubgroup.lesson_id,
+                       tables.LessonSubgroup.subgroup_id)
+                .join(tables.Lesson)
+                .filter(tables.Lesson.school_id == school_id)):
+            current_lessons[lesson_keys[lesson_id]][1].add(subgroup_id)
+        return current_lessons
+
+    def _get_diff(
+            self,
+            file_lessons: dict[tuple, tuple[dict[str, Any], set[int]]],
+            current_lessons: dict[tuple, tuple[dict[str, Any], set[int]]]
+    ) -> tuple[schemas.timetable.TimetableDiff, set[int]]:
+        """Уроки сравниваются по уникальному ключу. Оставшиеся без пары
+        уроки в том же месте расписания (неделя, день, время и подгруппы)
+        считаются изменёнными, а не удалёнными и добавленными заново.
+        Вместе с изменениями возвращает id таких заменённых уроков"""
+        diff = schemas.timetable.TimetableDiff()
+        added = {}
+        removed = {}
+        for key, (row, subgroup_ids) in file_lessons.items():
+            if key not in current_lessons:
+                added[key] = (row, subgroup_ids)
+                continue
+            current_row, current_subgroup_ids = current_lessons[key]
+            if (row['week'] != current_row['week']
+                    or subgroup_ids != current_subgroup_ids):
+                diff.changed.append(self._get_diff_lesson(
+                    row, subgroup_ids, current_row['lesson_id']
+                ))
+        for key, (row, subgroup_ids) in current_lessons.items():
+            if key not in file_lessons:
+                removed[key] = (row, subgroup_ids)
+
+        def get_slot(row, subgroup_ids):
+            return (row['week'], row['weekday'], row['start_time'],
+                    row['end_time'], frozenset(subgroup_ids))
+
+        replaced_ids = set()
+        added_slots = {}
+        for key, value in added.items():
+            added_slots.setdefault(get_slot(*value), []).append(key)
+        removed_slots = {}
+        for key, value in removed.items():
+            removed_slots.setdefault(get_slot(*value), []).append(key)
+        for slot, keys in added_slots.items():
+            if len(keys) != 1 or len(removed_slots.get(slot, [])) != 1:
+                continue
+            row, subgroup_ids = added.pop(keys[0])
+            current_row, _ = removed.pop(removed_slots[slot][0])
+            replaced_ids.add(current_row['lesson_id'])
+            diff.changed.append(self._get_diff_lesson(
+                row, subgroup_ids, current_row['lesson_id']
+            ))
+
+        diff.added = [self._get_diff_lesson(row, subgroup_ids)
+                      for row, subgroup_ids in added.values()]
+        diff.removed = [self._get_diff_lesson(row, subgroup_ids,
+                                              row['lesson_id'])
+                        for row, subgroup_ids in removed.values()]
+        return diff, replaced_ids
+
+    def _get_diff_lesson(
+            self,
+            row: dict[str, Any],
+            subgroup_ids: set[int],
+            lesson_id: int | None = None
+    ) -> schemas.timetable.TimetableDiffLesson:
+        return schemas.timetable.TimetableDiffLesson(
+            **row | {'lesson_id': lesson_id},
+            subgroup_ids=sorted(subgroup_ids)
+        )
+
+    def _get_table_row(
+            self,
+            lesson: schemas.timetable.TimetableDiffLesson,
+            school_id: int
+    ) -> dict[str, Any]:
+        row = lesson.dict(exclude={'subgroup_ids'}) | {'school_id': school_id}
+        row['start_time'] = dt.time(**row['start_time'])
+        row['end_time'] = dt.time(**row['end_time'])
+        if row['lesson_id'] is None:
+            row.pop('lesson_id')
+        return row
+
+    async def _apply_diff(
+            self,
+            diff: schemas.timetable.TimetableDiff,
+            school_id: int,
+            replaced_ids: set[int]
+    ):
+        """Изменения уроков сохраняются, только если у урока поменялись
+        неделя или подгруппы. У уроков, заменённых другим уроком в том же
+        месте расписания, они относились к старому уроку и удаляются"""
+        removed_ids = [lesson.lesson_id for lesson in diff.removed]
+        changed_ids = [lesson.lesson_id for lesson in diff.changed]
+        for lesson_ids in self._chunks(removed_ids + list(replaced_ids)):
+            await self.session.execute(
+                delete(tables.LessonHotfix)
+                .filter(tables.LessonHotfix.lesson_id.in_(lesson_ids))
             )
-            lesson_id = (await lesson_service.create(lesson_schema))['lesson_id']
-            class_id = (await class_service.get(class_schema=schemas.classes.ClassCreate(
-                number=lesson['class_number'],
-                letter=lesson['class_letter'],
-                school_id=school_id))
-            ).class_id
-
-            subgroup_id = (await subgroup_service.get(
-                    subgroup_schema=schemas.subgroups.BaseSubgroup(
-                        name=lesson['subgroup'],
-                        class_id=class_id
-                    )
-            )).subgroup_id
-            await lesson_service.add_subgroup_to_lesson(
-                schemas.subgroups_lessons.LessonSubgroup(
-                    subgroup_id=subgroup_id,
-                    lesson_id=lesson_id
-                )
+        for lesson_ids in self._chunks(removed_ids + changed_ids):
+            await self.session.execute(
+                delete(tables.LessonSubgroup)
+                .filter(tables.LessonSubgroup.lesson_id.in_(lesson_ids))
             )
+        for lesson_ids in self._chunks(removed_ids):
+            await self.session.execute(
+                delete(tables.Lesson)
+                .filter(tables.Lesson.lesson_id.in_(lesson_ids))
+            )
+        if diff.changed:
+            await self.session.execute(
+                update(tables.Lesson),
+                [self._get_table_row(lesson, school_id)
+                 for lesson in diff.changed]
+            )
+
+        lesson_ids = {}
+        for lessons in self._chunks(diff.added):
+            rows = [self._get_table_row(lesson, school_id)
+                    for lesson in lessons]
+            # Урок с тем же ключом мог быть создан параллельно через
+            # POST /api/lessons, тогда возвращается его id
+            query = insert(tables.Lesson).values(rows)
+            query = query.on_conflict_do_update(
+                index_elements=self.LESSON_KEY,
+                set_={'week': query.excluded.week}
+            ).returning(
+                tables.Lesson.lesson_id,
+                *[getattr(tables.Lesson, column)
+                  for column in self.LESSON_KEY]
+            )
+            for lesson_id, *key in await self.session.execute(query):
+                lesson_ids[tuple(key)] = lesson_id
+        for lesson in diff.added:
+            row = self._get_table_row(lesson, school_id)
+            lesson.lesson_id = lesson_ids[
+                tuple(row[column] for column in self.LESSON_KEY)
+            ]
+
+        link_rows = [
+            dict(lesson_id=lesson.lesson_id, subgroup_id=subgroup_id)
+            for lesson in diff.added + diff.changed
+            for subgroup_id in lesson.subgroup_ids
+        ]
+        for rows in self._chunks(link_rows):
+            await self.session.execute(insert(tables.LessonSubgroup)
+                                       .values(rows)
+                                       .on_conflict_do_nothing())
+
+    def _get_lesson_row(
+            self,
+            lesson: dict,
+            school_id: int
+    ) -> dict[str, Any]:
+        lesson_dct = schemas.lessons.LessonCreate(
+            name=lesson['name'],
+            start_time=schemas.times.Time(
+                hour=lesson['start_hour'],
+                minute=lesson['start_minute']
+            ),
+            end_time=schemas.times.Time(
+                hour=lesson['end_hour'],
+                minute=lesson['end_minute']
+            ),
+            week=lesson['week'],
+            weekday=lesson['weekday'],
+            room=get_room(lesson['room']),
+            school_id=school_id,
+            teacher_id=lesson['teacher_id']
+        ).dict()
+        lesson_dct['start_time'] = dt.time(**lesson_dct['start_time'])
+        lesson_dct['end_time'] = dt.time(**lesson_dct['end_time'])
+        return lesson_dct
+
+    def _chunks(self, rows: list) -> list[list]:
+        return [rows[i:i + self.CHUNK_SIZE]
+                for i in range(0, len(rows), self.CHUNK_SIZE)]
 
 
 class_teachers = {
@@ -155,11 +425,18 @@ def get_teacher(class_number, class_letter, lesson: str) -> str:
     return 1, ''
 
 def read_df(file: bytes):
-    df = pd.read_excel(file, header=4)
-    df['WeekDay'] = df['WeekDay'].fillna(method='ffill')
-    df.iloc[1] = df.iloc[1].fillna(method='ffill')
+    df = pd.read_excel(io.BytesIO(file), header=4)
+    df['WeekDay'] = df['WeekDay'].ffill()
+    df.iloc[1] = df.iloc[1].ffill()
     return df
 
+def get_room(room) -> str:
+    if room is None or pd.isna(room):
+        return ''
+    if isinstance(room, float) and room.is_integer():
+        room = int(room)
+    return str(room) if room else ''
+
 def split_class_name(class_name):
     try:
         letter = class_name[-1]
@@ -218,101 +495,121 @@ def split_lesson_times(start: tuple[int, int], end: tuple[int, int]):
     second_data = (second_start_hour, second_start_minute, second_end_hour, second_end_minute)
     return [first_data, second_data]
 
-def process_day(start: int, end: int, df, ndf):
+LESSON_COLUMNS = [
+    'class_number',
+    'class_letter',
+    'subgroup',
+    'name',
+    'teacher_id',
+    'week',
+    'weekday',
+    'start_hour',
+    'start_minute',
+    'end_hour',
+    'end_minute',
+    'room',
+    'required',
+    'teacher'
+]
+
+
+def process_day(start: int, end: int, df) -> list[dict]:
+    """Уроки одного блока таблицы между строками 'время'.
+
+    Возвращает записи, а не DataFrame: DataFrame создаётся один раз
+    в process_by_days"""
     class_columns = [column for column in df.columns if column.startswith('Unnamed')]
     class_names = dict([(column, df[column].iloc[start]) for column in class_columns])
-    for i in range(start + 1, end):
-        if str(df.iloc[i].WeekDay).lower() == 'nan':
+    weekdays = df['WeekDay'].iloc[start + 1:end].tolist()
+    times = df['Time'].iloc[start + 1:end].tolist()
+    class_lessons = dict([
+        (column, df[column].iloc[start + 1:end].tolist())
+        for column in class_names
+    ])
+    records = []
+    for i, (weekday_name, time) in enumerate(zip(weekdays, times)):
+        if str(weekday_name).lower() == 'nan' or str(time).lower() == 'nan':
             continue
+        # День и время разбираются только у строк с уроками: в строках
+        # без уроков в колонке Time может быть произвольный текст
+        lesson_times = None
         for class_column in class_names:
-            lesson = str(df[class_column].iloc[i])
-            if lesson.lower() != 'nan' and str(df.iloc[i].Time).lower() != 'nan':
-                lesson = lesson.replace('(1/2гр)', ' ')
-                number, letter = split_class_name(class_names[class_column])
-                start, end = split_time(df.iloc[i].Time)
-                for start_hour, start_minute, end_hour, end_minute in split_lesson_times(start, end):
-                    lesson_without_room, room = split_lesson(lesson)
-                    teacher_id, teacher = get_teacher(number, letter, lesson_without_room)
-                    weekday = get_weekday_number(df.iloc[i].WeekDay)
-                    required = lesson in required_lessons
-                    for room_index, subgroup in enumerate(['англ. Татьяна Петровна', 'англ. Светлана Николаевна']):
-                        new_row = pd.DataFrame({
-                            'class_number': [number],
-                            'class_letter': [letter],
-                            'subgroup': [subgroup],
-                            'name': [lesson_without_room],
-                            'teacher_id': [teacher_id],
-                            'week': [0],
-                            'weekday': [weekday],
-                            'start_hour': [start_hour],
-                            'start_minute': [start_minute],
-                            'end_hour': [end_hour],
-                            'end_minute': [end_minute],
-                            'room': room[room_index],
-                            'required': required,
-                            'teacher': teacher
-                        })
-                        ndf = pd.concat([ndf, new_row], ignore_index = True)
-    return ndf
-                
-
-def process_by_days(df, ndf):
-    gen = filter(
-        lambda index: (df.iloc[index].Time == 'время'),
-        range(len(df))
-    )
-    end = next(gen)
-    while True:
-        try:
-            start = end
-            end = next(gen)
-            ndf = process_day(start, end, df, ndf)
-        except StopIteration:
-            end = len(df)
-            ndf = process_day(start, end, df, ndf) 
-            break
-    return ndf
-
-
-def get_lessons_list(lessons_file: bytes) -> list[dict]:
-    ndf = pd.DataFrame(columns=[
-        'class_number', 
-        'class_letter', 
-        'subgroup', 
-        'name',
-        'teacher_id',
-        'week',
-        'weekday',
-        'start_hour',
-        'start_minute',
-        'end_hour',
-        'end_minute',
-        'room',
-        'required'
-    ])
-    return process_by_days(read_df(lessons_file), ndf).to_dict(orient='records')
-
-
-def get_timetable_data(lessons_file: bytes) -> dict[str, list]:
-    ndf = pd.DataFrame(columns=[
-        'class_number', 
-        'class_letter', 
-        'subgroup', 
-        'name',
-        'teacher_id',
-        'week',
-        'weekday',
-        'start_hour',
-        'start_minute',
-        'end_hour',
-        'end_minute',
-        'room',
-        'required'
-    ])
-    data = process_by_days(read_df(lessons_file), ndf).to_dict()
+            lesson = str(class_lessons[class_column][i])
+            if lesson.lower() == 'nan':
+                continue
+            if lesson_times is None:
+                lesson_start, lesson_end = split_time(time)
+                lesson_times = split_lesson_times(lesson_start, lesson_end)
+                weekday = get_weekday_number(weekday_name)
+            lesson = lesson.replace('(1/2гр)', ' ')
+            number, letter = split_class_name(class_names[class_column])
+            lesson_without_room, room = split_lesson(lesson)
+            teacher_id, teacher = get_teacher(number, letter, lesson_without_room)
+            required = lesson in required_lessons
+            for start_hour, start_minute, end_hour, end_minute in lesson_times:
+                for room_index, subgroup in enumerate(['англ. Татьяна Петровна', 'англ. Светлана Николаевна']):
+                    records.append({
+                        'class_number': number,
+                        'class_letter': letter,
+                        'subgroup': subgroup,
+                        'name': lesson_without_room,
+                        'teacher_id': teacher_id,
+                        'week': 0,
+                        'weekday': weekday,
+                        'start_hour': start_hour,
+                        'start_minute': start_minute,
+                        'end_hour': end_hour,
+                        'end_minute': end_minute,
+                        'room': room[room_index],
+                        'required': required,
+                        'teacher': teacher
+                    })
+    return records
+
+
+def process_by_days(df) -> pd.DataFrame:
+    separators = [
+        index for index, time in enumerate(df['Time'].tolist())
+        if time == 'время'
+    ]
+    records = []
+    for start, end in zip(separators, separators[1:] + [len(df)]):
+        records.extend(process_day(start, end, df))
+    return pd.DataFrame(records, columns=LESSON_COLUMNS)
+
+
+def parse_timetable(lessons_file: bytes) -> dict[str, list]:
+    """Один разбор файла: номера и буквы классов, названия подгрупп
+    и записи уроков (ключ lessons)"""
+    ndf = process_by_days(read_df(lessons_file))
     ret = {}
-    ret['class_numbers'] = list(set(data['class_number'].values()))
-    ret['class_letters'] = list(set(data['class_letter'].values()))
-    ret['subgroup_names'] = list(set(data['subgroup'].values()))
+    ret['class_numbers'] = list(set(ndf['class_number']))
+    ret['class_letters'] = list(set(ndf['class_letter']))
+    ret['subgroup_names'] = list(set(ndf['subgroup']))
+    ret['lessons'] = ndf.to_dict(orient='records')
     return ret
 
+
+_executor: ProcessPoolExecutor | None = None
+
+
+async def parse_timetable_async(lessons_file: bytes) -> dict[str, list]:
+    """parse_timetable в отдельном процессе, чтобы разбор xlsx
+    не останавливал event loop"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.parser_workers)
+    loop = asyncio.get_running_loop()
+    with parser_duration.time():
+        data = await loop.run_in_executor(_executor, parse_timetable,
+                                          lessons_file)
+    parser_rows.inc(len(data['lessons']))
+    return data
+
+
+def shutdown_parser():
+    """Останавливает процессы разбора, ожидающие файлы отменяются"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import sys
+import threading
+from collections import Counter
+
+from fastapi import HTTPException, status
+
+from time_api.db.create import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    """Сэмплирующий профилировщик потока event loop процесса.
+
+    Отдельный поток раз в interval секунд снимает стек через
+    sys._current_frames. Результат - стеки в формате folded (одна строка
+    "кадр;кадр;кадр число"), который принимают flamegraph.pl и speedscope"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.requests_left: int | None = None
+        self._target: int | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._done: asyncio.Event | None = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None
+
+    async def profile(
+            self,
+            duration: float,
+            requests: int | None = None
+    ) -> str:
+        """Профилирует duration секунд или, если задано requests, до
+        завершения стольких запросов, но не дольше duration"""
+        if self.is_running:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT)
+        self._start(requests)
+        try:
+            await asyncio.wait_for(self._done.wait(), duration)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._stop_sampling()
+        logger.info(f'Profiled {sum(self.stacks.values())} samples')
+        return '\n'.join(f'{stack} {count}'
+                         for stack, count in self.stacks.most_common())
+
+    def request_done(self):
+        if self.requests_left is None:
+            return
+        self.requests_left -= 1
+        if self.requests_left <= 0:
+            self._done.set()
+
+    def _start(self, requests: int | None):
+        self.stacks = Counter()
+        self.requests_left = requests
+        self._target = threading.get_ident()
+        self._done = asyncio.Event()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True,
+                                        name='profiler')
+        self._thread.start()
+
+    def _stop_sampling(self):
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.requests_left = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                stack.append(f'{frame.f_globals.get("__name__")}:'
+                             f'{frame.f_code.co_qualname}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+
+class ProfilerMiddleware:
+    """ASGI middleware, отсчитывающий завершённые запросы для
+    SamplingProfiler.profile с requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if scope['type'] == 'http':
+                profiler.request_done()
+
+
+profiler = SamplingProfiler(interval=settings.profiler_interval)
@@ -0,0 +1,184 @@
+import logging
+import sys
+import time
+from collections import deque
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from typing import Any
+
+from greenlet import getcurrent
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from time_api.db.create import settings
+from time_api.services.metrics import get_route
+
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger(f'{__name__}.slow')
+
+
+class QueryStats:
+    """Число запросов к БД и их суммарное время в рамках HTTP запроса"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+class SlowQuery:
+    def __init__(
+            self,
+            statement: str,
+            parameters: Any,
+            duration: float,
+            caller: str,
+            plan: str | None = None
+    ):
+        self.statement = statement
+        self.parameters = parameters
+        self.duration = duration
+        self.caller = caller
+        self.plan = plan
+        self.created_at = time.time()
+
+
+query_stats: ContextVar[QueryStats | None] = ContextVar('query_stats',
+                                                       default=None)
+slow_queries: deque[SlowQuery] = deque(maxlen=100)
+
+# Число запросов маршрута с холодными кэшами. Превышение в режиме debug
+# пишется в лог как ошибка, остальным маршрутам дано settings.query_budget.
+# tests/test_query_budgets.py проверяет, что маршруты делают ровно столько
+QUERY_BUDGETS = {
+    'GET /api': 0,
+    'GET /api/schools': 1,
+    'GET /api/schools/{school_id}': 1,
+    'GET /api/classes': 1,
+    'GET /api/classes/{class_id}': 1,
+    'GET /api/subgroups': 1,
+    'GET /api/subgroups/{subgroup_id}': 1,
+    'GET /api/teachers': 1,
+    'GET /api/teachers/{teacher_id}': 1,
+    'GET /api/semesters': 1,
+    'GET /api/semesters/current': 1,
+    'GET /api/semesters/{semester_id}': 1,
+    'GET /api/lessons': 6,
+    'GET /api/lessons/today': 6,
+    'GET /api/lessons/weekday': 6,
+    'GET /api/lessons/nearest_day': 7,
+}
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info['query_started_at'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    duration = time.perf_counter() - conn.info['query_started_at']
+    stats = query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += duration
+    if duration >= settings.slow_query_threshold:
+        _log_slow_query(conn, statement, parameters, duration)
+
+
+def _log_slow_query(conn, statement: str, parameters: Any, duration: float):
+    plan = None
+    if settings.slow_query_explain \
+            and statement.lstrip().upper().startswith('SELECT'):
+        plan = _explain(conn, statement, parameters)
+    query = SlowQuery(statement, parameters, duration, _get_caller(), plan)
+    slow_queries.append(query)
+    slow_query_logger.warning(
+        f'Slow query {duration:.3f}s in {query.caller}: {statement} '
+        f'{parameters!r}' + (f'\n{plan}' if plan else '')
+    )
+
+
+def _explain(conn, statement: str, parameters: Any) -> str | None:
+    """EXPLAIN ANALYZE повторно выполняет запрос, поэтому делается только
+    для SELECT и в отдельном курсоре, не трогая результат исходного"""
+    try:
+        cursor = conn.connection.dbapi_connection.cursor()
+        cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {statement}', parameters)
+        plan = '\n'.join(row[0] for row in cursor.fetchall())
+        cursor.close()
+        return plan
+    except Exception as e:
+        logger.warning(f'Query plan is unavailable: {e!r}')
+        return None
+
+
+def _get_caller() -> str:
+    """Метод сервиса, выполнивший запрос. Async запросы SQLAlchemy
+    выполняются в дочернем greenlet, поэтому просматривается и стек
+    родительского"""
+    frames = [sys._getframe()]
+    parent = getcurrent().parent
+    if parent is not None and parent.gr_frame is not None:
+        frames.append(parent.gr_frame)
+    for frame in frames:
+        while frame is not None:
+            code = frame.f_code
+            if '/time_api/services/' in code.co_filename \
+                    and not code.co_filename.endswith('queries.py'):
+                owner = frame.f_locals.get('self')
+                if owner is None:
+                    return code.co_name
+                return f'{type(owner).__name__}.{code.co_name}'
+            frame = frame.f_back
+    return 'unknown'
+
+
+class QueryCounterMiddleware:
+    """ASGI middleware, считающий запросы к БД каждого HTTP запроса.
+
+    Добавляет заголовок Server-Timing, а в режиме debug пишет ошибку в лог
+    при превышении бюджета запросов маршрута"""
+
+    def __init__(self, app, debug: bool, budget: int):
+        self.app = app
+        self.debug = debug
+        self.budget = budget
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        stats = QueryStats()
+        token = query_stats.set(stats)
+
+        async def _send(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = list(message.get('headers', [])) + [(
+                    b'server-timing',
+                    f'db;dur={stats.duration * 1000:.1f};'
+                    f'desc="{stats.count} queries"'.encode()
+                )]
+                if self.debug:
+                    self.check_budget(scope, stats)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            query_stats.reset(token)
+
+    def check_budget(self, scope, stats: QueryStats):
+        route = f'{scope["method"]} {get_route(scope)}'
+        budget = QUERY_BUDGETS.get(route, self.budget)
+        if stats.count > budget:
+            logger.error(f'{route} made {stats.count} queries, '
+                         f'budget is {budget}')
+
+
+if settings.slow_query_log_file:
+    _handler = RotatingFileHandler(settings.slow_query_log_file,
+                                   maxBytes=10 * 1024 * 1024, backupCount=5)
+    _handler.setFormatter(logging.Formatter('[%(asctime)s] %(message)s'))
+    slow_query_logger.addHandler(_handler)
@@ -6,6 +6,7 @@ from fastapi import HTTPException, status
 from .base import BaseService
 from time_api.db import tables
 from time_api import schemas
+from time_api.services.cache import schedule_version
 
 
 logger = logging.getLogger(__name__)
@@ -53,6 +54,7 @@ class SchoolService(BaseService):
             school = tables.School(**school_schema.dict())
             self.session.add(school)
             await self.session.commit()
+            await schedule_version.bump(school.school_id)
 
         except exc.IntegrityError:
             await self.session.rollback()
@@ -70,4 +72,5 @@ class SchoolService(BaseService):
         school = await self.get(school_id=school_id)
         await self.session.delete(school)
         await self.session.commit()
+        await schedule_version.bump(school_id)
 
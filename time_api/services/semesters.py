@@ -8,6 +8,7 @@ from fastapi import status, HTTPException
 from .base import BaseService
 from time_api.db import tables
 from time_api import schemas
+from time_api.services.cache import schedule_version
 
 
 logger = logging.getLogger(__name__)
@@ -101,6 +102,7 @@ class SemesterService(BaseService):
             semester = tables.Semester(**dct)
             self.session.add(semester)
             await self.session.commit()
+            await schedule_version.bump(semester.school_id)
 
         except exc.IntegrityError:
             await self.session.rollback()
@@ -118,3 +120,4 @@ class SemesterService(BaseService):
         semester = await self.get(semester_id=semester_id)
         await self.session.delete(semester)
         await self.session.commit()
+        await schedule_version.bump(semester.school_id)
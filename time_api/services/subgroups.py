@@ -7,6 +7,7 @@ from fastapi import status, HTTPException
 from .base import BaseService
 from time_api import schemas
 from time_api.db import tables
+from time_api.services.cache import schedule_version
 
 logger = logging.getLogger(__name__)
 
@@ -92,6 +93,11 @@ class SubgroupService(BaseService):
             new_subgroup = tables.Subgroup(**subgroup_schema.dict())
             self.session.add(new_subgroup)
             await self.session.commit()
+            await schedule_version.bump(await self.session.scalar(
+                select(tables.Class.school_id).filter_by(
+                    class_id=new_subgroup.class_id
+                )
+            ))
         except exc.IntegrityError:
             await self.session.rollback()
             new_subgroup = await self.get(subgroup_schema=subgroup_schema)
@@ -102,5 +108,9 @@ class SubgroupService(BaseService):
             subgroup_id: int,
     ):
         subgroup = await self.get(subgroup_id=subgroup_id)
+        school_id = await self.session.scalar(
+            select(tables.Class.school_id).filter_by(class_id=subgroup.class_id)
+        )
         await self.session.delete(subgroup)
         await self.session.commit()
+        await schedule_version.bump(school_id)
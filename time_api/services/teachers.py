@@ -6,6 +6,7 @@ from fastapi import status, HTTPException
 from .base import BaseService
 from time_api import schemas
 from time_api.db import tables
+from time_api.services.cache import schedule_version
 
 
 logger = logging.getLogger(__name__)
@@ -56,3 +57,4 @@ class TeacherService(BaseService):
         teacher = await self.get(teacher_id=teacher_id)
         await self.session.delete(teacher)
         await self.session.commit()
+        await schedule_version.bump()